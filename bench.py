@@ -0,0 +1,237 @@
+# benchmarks of the energy kernels and the move loop of the monte carlo code
+import sys, argparse, itertools, json, time, platform
+import numpy as np
+from box import box
+from configs import initialize
+from energy import energy
+from moves import moves
+from rng import rng
+
+# command line options that hold a comma separated list of values
+gridkeys = ['N', 'rho', 'ndim', 'ensemble']
+kernels = ['calcenergy', 'calcfullenergy', 'calcforces', 'move']
+
+class case(object):
+  def __init__(self,nmol,rho,ndim,ensemble,rc=3.,usecells=False,skin=0.,seed=1):
+    """Set up the system of one benchmark case
+
+    Parameters
+    ----------
+    nmol : int
+        number of molecules
+    rho : float
+        number density, sets the box length
+    ndim : int
+        number of dimensions
+    ensemble : string
+        NVT or muVT
+    rc : float
+        cutoff, at most half the box length
+    usecells : bool
+        use a cell list
+    skin : float
+        Verlet list skin, 0 for none
+    seed : int
+        random seed of the configuration and the moves
+
+    """
+    self.nmol = nmol
+    self.rho = rho
+    self.ndim = ndim
+    self.ensemble = ensemble
+    length = (nmol/float(rho))**(1./ndim)
+    self.rng = rng(seed)
+    self.bx = box()
+    self.bx.setedges([length]*ndim)
+    self.rc = min(rc, length/2.)
+    T = 2.
+    self.en = energy(nmol, self.bx, T)
+    self.en.setparameters(1., 1., self.rc)
+    self.parts = initialize(nmol, self.rng).random(nmol, self.bx)
+    if usecells:
+      self.bx.setcells(self.rc, self.parts)
+    if skin > 0:
+      self.en.setverlet(skin, self.parts)
+    self.mv = moves(self.parts, self.bx, self.en, T, -3., self.rng)
+    if ensemble == 'muVT':
+      self.mv.setmovemix(0.6, 0.4)
+    else:
+      self.mv.setmovemix(1.0, 0.0)
+    self.mv.settranslation(0.5)
+    self.en.calcfullenergy(self.parts)
+
+  def move(self):
+    """One MC move of the ensemble's move mix
+    moves.move only displaces molecules while its choice of move type is
+    left to the project, so the insertions and deletions of muVT are done
+    here: the trial position of moves.insert and its energy, or the energy
+    of a random molecule, after which the molecule is always placed or
+    deleted. Insertions and deletions alternate so N stays put
+    """
+    if self.rng.random() < self.mv.frac_displacement:
+      self.mv.move()
+    elif self.parts.nmol <= self.nmol:
+      trial, tnm = self.mv.insert()
+      self.en.calcenergy(self.parts, tnm, trial)
+      self.mv.place(tnm, trial)
+    else:
+      im = self.rng.randint(self.parts.nmol)
+      self.en.calcenergy(self.parts, im)
+      self.mv.delete(im)
+
+  def key(self):
+    return {'N': self.nmol, 'rho': self.rho, 'ndim': self.ndim, 'ensemble': self.ensemble}
+
+  def time(self,kernel,mintime=0.2):
+    """Time one kernel
+
+    Parameters
+    ----------
+    kernel : string
+        one of calcenergy, calcfullenergy, calcforces or move
+    mintime : float
+        the kernel is called until this many seconds have passed
+
+    Returns
+    -------
+    result : dictionary
+        calls, seconds, calls per second and pair separations per second
+
+    """
+    ncall = 0
+    npair = self.en.npaircount
+    start = time.perf_counter()
+    elapsed = 0.
+    while elapsed < mintime:
+      if kernel == 'calcenergy':
+        imol = self.rng.randint(self.parts.nmol)
+        self.en.calcenergy(self.parts, imol)
+      elif kernel == 'calcfullenergy':
+        self.en.calcfullenergy(self.parts)
+      elif kernel == 'calcforces':
+        # calcvirial resets the virial sums and calls calcforces
+        self.en.calcvirial(self.parts)
+      elif kernel == 'move':
+        self.move()
+      ncall += 1
+      elapsed = time.perf_counter() - start
+    result = {'kernel': kernel, 'calls': ncall, 'seconds': elapsed,
+              'calls_per_s': ncall/elapsed}
+    if kernel == 'move':
+      result['moves_per_s'] = ncall/elapsed
+    else:
+      result['pairs_per_s'] = (self.en.npaircount - npair)/elapsed
+    return result
+
+def run(grid,rc=3.,usecells=False,skin=0.,mintime=0.2,seed=1):
+  """Time every kernel in every case of the grid
+
+  Parameters
+  ----------
+  grid : dictionary of lists
+      values of N, rho, ndim and ensemble, every combination is a case
+  rc, usecells, skin, seed :
+      see case
+  mintime : float
+      seconds spent on each kernel of each case
+
+  Returns
+  -------
+  report : dictionary
+      machine and options under 'meta', one entry per case and kernel under 'results'
+
+  """
+  report = {'meta': {'python': platform.python_version(), 'numpy': np.__version__,
+                     'machine': platform.machine(), 'platform': platform.platform(),
+                     'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'rc': rc,
+                     'cells': usecells, 'skin': skin, 'mintime': mintime,
+                     'muVT': 'move is 60% moves.move displacements and 40% insertions and '
+                             'deletions done through moves.insert, place and delete, see case.move'},
+            'results': []}
+  for nmol, rho, ndim, ensemble in itertools.product(*[grid[key] for key in gridkeys]):
+    bench = case(nmol, rho, ndim, ensemble, rc, usecells, skin, seed)
+    for kernel in kernels:
+      result = bench.key()
+      result.update(bench.time(kernel, mintime))
+      report['results'].append(result)
+      print('N %6d rho %.2f %dD %-4s %-14s %12.1f calls/s' % (nmol, rho, ndim, ensemble,
+                                                             kernel, result['calls_per_s']))
+  return report
+
+def compare(report,baseline,tolerance=0.2):
+  """Compare the rates against a baseline report
+
+  Parameters
+  ----------
+  report, baseline : dictionaries
+      from run
+  tolerance : float
+      a kernel is a regression when it is slower than the baseline by more than this fraction
+
+  Returns
+  -------
+  regressions : list of dictionaries
+      the results that regressed, with the baseline rate and the ratio
+
+  """
+  def label(result):
+    return tuple(result[key] for key in gridkeys + ['kernel'])
+  base = dict([(label(result), result) for result in baseline['results']])
+  regressions = []
+  for result in report['results']:
+    if label(result) not in base:
+      continue
+    ratio = result['calls_per_s']/base[label(result)]['calls_per_s']
+    result['baseline_calls_per_s'] = base[label(result)]['calls_per_s']
+    result['ratio'] = ratio
+    if ratio < 1. - tolerance:
+      regressions.append(result)
+      print('REGRESSION N %d rho %g %dD %s %s: %.2f of baseline' % (result['N'], result['rho'],
+            result['ndim'], result['ensemble'], result['kernel'], ratio))
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark the energy kernels and MC moves, '
+                                   'comma separated values of -N, --rho, --ndim and --ensemble are run on a grid')
+  parser.add_argument("-N", type=str, default='100,1000,10000',
+                 help='numbers of molecules')
+  parser.add_argument("--rho", type=str, default='0.3,0.8',
+                 help='number densities')
+  parser.add_argument("--ndim", type=str, default='1,2,3',
+                 help='numbers of dimensions')
+  parser.add_argument("--ensemble", type=str, default='NVT,muVT',
+                 help='NVT and/or muVT move mixes')
+  parser.add_argument("--rc", type=float, default=3.,
+                 help='cutoff, at most half the box length')
+  parser.add_argument("--cells", action='store_true',
+                 help='use a cell list')
+  parser.add_argument("--skin", type=float, default=0.,
+                 help='Verlet list skin, off if 0')
+  parser.add_argument("--mintime", type=float, default=0.2,
+                 help='seconds spent timing each kernel')
+  parser.add_argument("--seed", type=int, default=1,
+                 help='random seed')
+  parser.add_argument("--outfile", type=str, default='bench.json',
+                 help='JSON report')
+  parser.add_argument("--baseline", type=str, default=None,
+                 help='JSON report of an earlier run to compare against')
+  parser.add_argument("--tolerance", type=float, default=0.2,
+                 help='slowdown relative to the baseline reported as a regression')
+  args = parser.parse_args(argv)
+  grid = {'N': [int(n) for n in args.N.split(',')],
+          'rho': [float(rho) for rho in args.rho.split(',')],
+          'ndim': [int(ndim) for ndim in args.ndim.split(',')],
+          'ensemble': args.ensemble.split(',')}
+  report = run(grid, args.rc, args.cells, args.skin, args.mintime, args.seed)
+  regressions = []
+  if args.baseline is not None:
+    with open(args.baseline) as basefile:
+      regressions = compare(report, json.load(basefile), args.tolerance)
+    report['meta']['baseline'] = args.baseline
+  with open(args.outfile, 'w') as outfile:
+    json.dump(report, outfile, indent=1)
+  if len(regressions) > 0:
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
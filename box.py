@@ -1,7 +1,8 @@
 import numpy as np
+from neighbors import celllist
 class box(object):
   def __init__(self):
-    return
+    self.cells = None
   def setedges(self,edges):
     """Setup the simulation box
 
@@ -35,6 +36,25 @@ class box(object):
     for idim in range(self.ndim):
       self.vol *= (self.box[1,idim]-self.box[0,idim])
 
+  def setcells(self,rc,parts):
+    """Set up a cell list so single-molecule energies only visit nearby molecules
+
+    Inputs
+    ------
+    rc : float
+       interaction cutoff distance
+    parts : class
+       particle store, see particles.py
+
+    Parameters
+    ----------
+    self.cells : class
+        linked-cell list, see neighbors.py
+
+    """
+    self.cells = celllist(self, rc, parts)
+    self.cells.build()
+
   def applypbc(self,pos):
     """Apply periodic boundary conditions
 
@@ -49,3 +69,26 @@ class box(object):
         pos[idim] += self.boxlength[idim]
       elif pos[idim] > self.half_boxlength[idim]: 
         pos[idim] -= self.boxlength[idim]
+
+  def minimage(self,r):
+    """Apply periodic boundary conditions to many separations at once
+    Vectorized version of applypbc
+
+    Inputs
+    ------
+    r : numpy array, last dimension of length ndim
+       separation vectors which will be manipulated (in place) for PBCs
+
+    """
+    r -= self.boxlength*np.round(r/self.boxlength)
+
+  def wrap(self,pos):
+    """Put positions back in the box with periodic boundary conditions
+
+    Inputs
+    ------
+    pos : numpy array, last dimension of length ndim
+       position(s) which will be manipulated (in place)
+
+    """
+    pos -= self.boxlength*np.floor((pos - self.box[0])/self.boxlength)
@@ -0,0 +1,73 @@
+import os
+import threading
+import numpy as np
+class checkpoint(object):
+  def __init__(self,fname='mc'):
+    """Initiate checkpoint file class
+    The state of every part of the simulation is a dictionary of arrays
+    and numbers (see the getstate methods), they are stored together in
+    one uncompressed numpy .npz file with keys part/name
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning, the checkpoint is fname.chk
+
+    self.thread : threading.Thread
+        the write in progress, if any
+
+    """
+    self.fname = fname + '.chk'
+    self.thread = None
+    self.nwrite = 0
+
+  def write(self,state):
+    """Write a checkpoint in the background
+    The state must already be a copy, the move loop carries on while it is
+    written; the file is replaced in one step so it is never half written
+
+    Parameters
+    ----------
+    state : dictionary of dictionaries
+        state of each part of the simulation
+
+    """
+    self.wait()
+    flat = {}
+    for part in state:
+      for name in state[part]:
+        flat[part + '/' + name] = np.asarray(state[part][name])
+    self.thread = threading.Thread(target=self.save, args=(flat,))
+    self.thread.start()
+    self.nwrite += 1
+
+  def save(self,flat):
+    """Write to a temporary file and move it over the checkpoint"""
+    tmpname = self.fname + '.tmp'
+    with open(tmpname, 'wb') as tmpfile:
+      np.savez(tmpfile, **flat)
+      tmpfile.flush()
+      os.fsync(tmpfile.fileno())
+    os.replace(tmpname, self.fname)
+
+  def wait(self):
+    """Wait for the write in progress"""
+    if self.thread is not None:
+      self.thread.join()
+      self.thread = None
+
+  def read(self):
+    """Read the checkpoint
+
+    Returns
+    -------
+    state : dictionary of dictionaries
+        state of each part of the simulation
+
+    """
+    state = {}
+    with np.load(self.fname) as data:
+      for key in data.files:
+        part, name = key.split('/', 1)
+        state.setdefault(part, {})[name] = data[key]
+    return state
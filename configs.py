@@ -1,7 +1,8 @@
 import numpy as np
-import random as rand
-import sys
+import sys, argparse
 import matplotlib.pyplot as plt
+from particles import particles
+from rng import rng
 
 class movie(object):
   def __init__(self,s,box):
@@ -21,30 +22,39 @@ class movie(object):
 
     self.figsize = (5,5*yfactor)
 
-  def update(self,pos,exist):
+  def update(self,parts):
     """Update the movie
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    exist : 1d numpy array
-       either 1 or 0 (not existant), used for muVT
+    parts : class
+        particle store, see particles.py
 
     """
     # ims is a list of lists, each row is a list of artists to draw in the
     # current frame; here we are just animating one artist, the image, in
     # each frame
     plt.subplots(figsize=self.figsize)
-    tnmol = sum(exist)
-    im = plt.scatter(pos[:tnmol,0], pos[:tnmol,1], s=self.size)
+    tnmol = parts.nmol
+    im = plt.scatter(parts.pos[:tnmol,0], parts.pos[:tnmol,1], s=self.size)
     plt.xlim(self.box[:,0])
     plt.ylim(self.box[:,1])
     plt.show()
         
 class initialize(object):
-  def __init__(self,maxn):
+  def __init__(self,maxn,stream=None):
+    """Initiate configuration generator
+
+    Parameters
+    ----------
+    maxn : int
+        maximum number of molecules
+    stream : class
+        random number stream of the run, see rng.py
+
+    """
     self.maxn = maxn
+    self.rng = stream if stream is not None else rng()
 
   def random(self,nmol,box):
     """Generate random initial configuration
@@ -56,21 +66,26 @@ class initialize(object):
     box : class
        simulation box parameter information, see box.py
 
+    Returns
+    -------
+    parts : class
+        particle store, see particles.py
+
     """
     if nmol > self.maxn:
         print('ERROR: Max number of molecules is: %d' % self.maxn)
         sys.exit()
 
-    pos = np.zeros((self.maxn,box.ndim))
-    posexist = np.zeros((self.maxn))
+    pos = np.zeros((nmol,box.ndim))
     for imol in range(nmol):
       for idim in range(box.ndim):
-        pos[imol,idim] = rand.uniform(box.box[0,idim],box.box[1,idim])
-        posexist[imol] = 1
-    return pos, posexist
+        pos[imol,idim] = self.rng.uniform(box.box[0,idim],box.box[1,idim])
+    parts = particles(box.ndim, nmol)
+    parts.setpositions(pos)
+    return parts
 
 class configfile(object):
-  def __init__(self,ndim, fname='config'):
+  def __init__(self,ndim, fname='config', append=False):
     """Initiate configuration file class
 
     Parameters
@@ -79,31 +94,232 @@ class configfile(object):
         number of simulation dimensions
     fname : string
        file output name
+    append : bool
+       continue an existing file, e.g. on restart
 
     """
-    self.file = open(fname + '.xyz', 'w')
+    self.file = open(fname + '.xyz', 'a' if append else 'w')
     self.ndim = ndim
 
-  def writeframe(self,imove,pos, nmol):
-    """Generate random initial configuration
+  def writeframe(self,imove,parts):
+    """Write the configuration as an xyz frame
 
     Parameters
     ----------
     imove : int
         MC move number
-    pos : 2d numpy array 
-        positions of all molecues
-    nmol : int
-        number of molecules
+    parts : class
+        particle store, see particles.py
 
     """
+    self.writepositions(imove, parts.pos[:parts.nmol,:])
+
+  def writepositions(self,imove,pos):
+    """Write positions as an xyz frame, missing dimensions are written as 0
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+    pos : 2d numpy array (nmol, ndim)
+        positions of all molecules
+
+    """
+    nmol = pos.shape[0]
+    xyz = np.zeros((nmol, 3))
+    xyz[:,:self.ndim] = pos
     self.file.write('%d\nframe %d\n' % (nmol, imove))
-    if self.ndim == 3:
-      for imol in range(nmol):
-        self.file.write('C %f %f %f\n' % (pos[imol,0],pos[imol,1],pos[imol,2]))
-    elif self.ndim == 2:
-      for imol in range(nmol):
-        self.file.write('C %f %f 0.0\n' % (pos[imol,0],pos[imol,1]))
-    elif self.ndim == 1:
-      for imol in range(nmol):
-        self.file.write('C %f 0.0 0.0\n' % (pos[imol,0]))
+    self.file.write(''.join(['C %f %f %f\n' % tuple(row) for row in xyz.tolist()]))
+
+  def getstate(self):
+    """Length of the file, e.g. for a checkpoint"""
+    self.file.flush()
+    return {'offset': self.file.tell()}
+
+  def setstate(self,state):
+    """Drop the frames written after getstate"""
+    self.file.truncate(int(state['offset']))
+
+  def close(self):
+    self.file.close()
+
+# binary trajectory layout: a file header of the magic string, ndim and
+# the float size, then every frame is (step, nmol) as int64 followed by
+# the nmol*ndim coordinates
+trajmagic = b'LMCTRAJ1'
+trajheader = 24
+frameheader = 16
+
+class trajectory(object):
+  def __init__(self,ndim,fname='config',precision='float32',append=False):
+    """Initiate binary trajectory writer
+    Frames are appended to fname.traj and the byte offset of every frame
+    is appended to fname.tridx, see trajectoryreader
+
+    Parameters
+    ----------
+    ndim : int
+        number of simulation dimensions
+    fname : string
+       file output name
+    precision : string
+        float32 or float64 coordinates
+    append : bool
+       continue an existing file, e.g. on restart
+
+    """
+    self.ndim = ndim
+    self.dtype = np.dtype(precision)
+    if append:
+      self.file = open(fname + '.traj', 'ab')
+      self.indexfile = open(fname + '.tridx', 'ab')
+      self.offset = self.file.tell()
+    else:
+      self.file = open(fname + '.traj', 'wb')
+      self.indexfile = open(fname + '.tridx', 'wb')
+      self.file.write(trajmagic)
+      self.file.write(np.array([ndim, self.dtype.itemsize], dtype=np.int64).tobytes())
+      self.offset = trajheader
+
+  def writeframe(self,imove,parts):
+    """Append the configuration as a binary frame
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+    parts : class
+        particle store, see particles.py
+
+    """
+    nmol = parts.nmol
+    self.file.write(np.array([imove, nmol], dtype=np.int64).tobytes())
+    self.file.write(parts.pos[:nmol,:].astype(self.dtype).tobytes())
+    self.indexfile.write(np.array([self.offset], dtype=np.int64).tobytes())
+    self.offset += frameheader + nmol*self.ndim*self.dtype.itemsize
+
+  def getstate(self):
+    """Length of the trajectory and index, e.g. for a checkpoint"""
+    self.file.flush()
+    self.indexfile.flush()
+    return {'offset': self.offset, 'indexoffset': self.indexfile.tell()}
+
+  def setstate(self,state):
+    """Drop the frames written after getstate"""
+    self.offset = int(state['offset'])
+    self.file.truncate(self.offset)
+    self.indexfile.truncate(int(state['indexoffset']))
+
+  def close(self):
+    self.file.close()
+    self.indexfile.close()
+
+class trajectoryreader(object):
+  def __init__(self,fname='config'):
+    """Memory-map a binary trajectory for random access to its frames
+    The frame index is rebuilt from the frame headers if the .tridx
+    file is missing or does not end where the file ends
+
+    Parameters
+    ----------
+    fname : string
+       file name beginning
+
+    self.offsets : 1d int array
+        byte offset of every frame
+
+    """
+    self.map = np.memmap(fname + '.traj', dtype=np.uint8, mode='r')
+    if bytes(self.map[:len(trajmagic)]) != trajmagic:
+      print('ERROR: %s.traj is not a trajectory file' % fname)
+      sys.exit()
+    self.ndim, itemsize = np.frombuffer(self.map, dtype=np.int64, count=2,
+                                        offset=len(trajmagic))
+    self.ndim = int(self.ndim)
+    self.dtype = np.dtype('float%d' % (8*itemsize))
+    try:
+      self.offsets = np.fromfile(fname + '.tridx', dtype=np.int64)
+    except IOError:
+      self.offsets = np.zeros((0), dtype=np.int64)
+    # an index of a longer file, e.g. one truncated to a checkpoint, may
+    # point past the end
+    if (len(self.offsets) == 0 or self.offsets[-1] + frameheader > len(self.map)
+        or self.frameend(len(self.offsets)-1) != len(self.map)):
+      self.reindex()
+
+  def frameend(self,iframe):
+    """Byte offset just past a frame"""
+    step, nmol = self.header(iframe)
+    return int(self.offsets[iframe]) + frameheader + nmol*self.ndim*self.dtype.itemsize
+
+  def reindex(self):
+    """Rebuild the frame offsets by walking the frame headers, a
+    partly written last frame is dropped"""
+    offsets = []
+    offset = trajheader
+    while offset + frameheader <= len(self.map):
+      nmol = int(np.frombuffer(self.map, dtype=np.int64, count=1, offset=offset+8)[0])
+      end = offset + frameheader + nmol*self.ndim*self.dtype.itemsize
+      if end > len(self.map):
+        break
+      offsets.append(offset)
+      offset = end
+    self.offsets = np.array(offsets, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def header(self,iframe):
+    """MC move number and number of molecules of a frame"""
+    step, nmol = np.frombuffer(self.map, dtype=np.int64, count=2,
+                               offset=int(self.offsets[iframe]))
+    return int(step), int(nmol)
+
+  def frame(self,iframe):
+    """Read a frame without copying
+
+    Parameters
+    ----------
+    iframe : int
+        frame number
+
+    Returns
+    -------
+    step : int
+        MC move number of the frame
+    pos : 2d numpy array (nmol, ndim)
+        read-only view of the positions
+
+    """
+    step, nmol = self.header(iframe)
+    pos = np.ndarray((nmol, self.ndim), dtype=self.dtype, buffer=self.map,
+                     offset=int(self.offsets[iframe]) + frameheader)
+    return step, pos
+
+  def toxyz(self,fname):
+    """Convert to a text xyz file
+
+    Parameters
+    ----------
+    fname : string
+       xyz file name beginning
+
+    """
+    xyz = configfile(self.ndim, fname)
+    for iframe in range(len(self)):
+      step, pos = self.frame(iframe)
+      xyz.writepositions(step, pos)
+    xyz.close()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Convert a binary trajectory to xyz')
+  parser.add_argument("trajectory", type=str,
+                 help='trajectory file name root, reads root.traj')
+  parser.add_argument("--outfile", type=str, default=None,
+                 help='xyz file name root, defaults to the trajectory root')
+  args = parser.parse_args(argv)
+  traj = trajectoryreader(args.trajectory)
+  traj.toxyz(args.outfile if args.outfile is not None else args.trajectory)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 import math as ma
 import numpy as np
+from neighbors import verletlist
+from potential import potential, mix
 class energy(object):
   def __init__(self,nmol,box, temp):
     """Initiate energy class
@@ -15,7 +17,6 @@ class energy(object):
         temperature
 
     """
-    yfactor = (box.box[1,1]-box.box[0,1])/(box.box[1,0]-box.box[0,0])
     self.calctensor = False
     self.nmol = nmol
     self.box = box
@@ -23,157 +24,516 @@ class energy(object):
     self.vol = box.vol
     self.rho = nmol/box.vol
     self.T = temp
+    # running total energy, updated by every accepted move
+    self.tu = 0.0
+    # with splitsums the r^-12 part of tu is kept as well (tu12), and
+    # calcenergy leaves the r^-12 part of its result in u12, see rescale
+    self.splitsums = False
+    self.nspecies = 1
+    self.tu12 = 0.0
+    self.u12 = 0.0
+    # (step, running energy, recomputed energy) at every drift check
+    self.drift = []
+    # error of the running total taken out by samples since the last
+    # drift check, see resettotal
+    self.absorbed = 0.0
+    # number of pair separations held in memory at once by pairs()
+    self.pairblock = 2**18
+    # pair separations computed so far by the kernels, for the profiler
+    self.npaircount = 0
+    self.verlet = None
 
-  def setparameters(self,sigma=1.,epsilon=1.,cutoff=-1):    
+  def setparameters(self,sigma=1.,epsilon=1.,cutoff=-1,form='truncated',tabletol=0.,
+                    mixing='lb',overrides=None):
     """Set up the interaction parameters
 
     Parameters
     ----------
-    sigma : float
-        LJ distance
-    epsilon : float
-        LJ interaction strength
+    sigma : float or list of floats
+        LJ distance, one per species for a mixture
+    epsilon : float or list of floats
+        LJ interaction strength, one per species for a mixture
     cutoff : float
-        interaction cutoff distance
+        interaction cutoff distance, the largest of a mixture
+    form : string
+        truncated (with tail corrections), shifted or forceshifted, see potential.py
+    tabletol : float
+        accuracy of the interpolation tables of the potential, 0 for the analytic form
+    mixing : string
+        rule for the parameters of unlike species, see potential.mix
+    overrides : dictionary
+        (i, j) : (sigma, epsilon) or (sigma, epsilon, rc) of a pair of
+        species instead of the mixing rule, see potential.mix
+
+    self.pot : class
+        pair potential, see potential.py
+    self.nspecies : int
+        number of species
 
     """
-    self.a = 4.*epsilon*sigma**12.
-    self.b = 4.*epsilon*sigma**6.
-    self.fprea = 48. * epsilon * sigma**12.
-    self.fpreb = 24. * epsilon * sigma**6.
     if cutoff < 0:
       self.rc =(self.box[1,0]/2.)
     else:
       self.rc = cutoff
+    self.nspecies = 1 if np.ndim(sigma) == 0 else len(sigma)
+    if self.nspecies > 1:
+      sigma, epsilon, rcs = mix(sigma, epsilon, self.rc, mixing, overrides)
+      # pair cutoffs stay in proportion when the box is scaled, see setcutoff
+      self.rcratio = rcs/self.rc
+    elif np.ndim(sigma) > 0:
+      sigma = sigma[0]
+      epsilon = epsilon[0]
+    self.a = 4.*epsilon*sigma**12.
+    self.b = 4.*epsilon*sigma**6.
+    self.fprea = 48. * epsilon * sigma**12.
+    self.fpreb = 24. * epsilon * sigma**6.
+    self.sigma = sigma
+    self.epsilon = epsilon
+    self.form = form
+    self.tabletol = tabletol
+    self.setcutoff(self.rc)
+
+  def setcutoff(self,rc):
+    """Set up the pair potential for a cutoff, e.g. after the box was scaled
+
+    Parameters
+    ----------
+    rc : float
+        interaction cutoff distance
+
+    """
+    self.rc = rc
     self.rc2 = self.rc * self.rc
-    # if you want to add tail interactions
-    # self.rho = self.nmol/self.vol
-    # factor = 8./3.*3.14159*self.rho
-    # etail = factor*((1/3.)*self.rc**9.-self.rc**3.)
-    # ptail = 2.*factor *self.rho*((2./3.)*self.rc**9.-self.rc**3.)
+    npoints = self.pot.npoints if getattr(self, 'pot', None) is not None and self.pot.table else 256
+    rcs = self.rc*self.rcratio if self.nspecies > 1 else self.rc
+    self.pot = potential(self.sigma, self.epsilon, rcs, self.form, self.ndim)
+    if self.tabletol > 0:
+      self.pot.tabulate(self.tabletol, npoints=npoints)
 
-  def calcforces(self,pos,nmol):
-    """Calculate the forces
+  def rescale(self,s):
+    """Energy after scaling the box and the cutoff by s
+    Every pair keeps its place relative to the cutoff, so the r^-12 part
+    of the energy scales as s^-12 and the rest as s^-6 (tails included)
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    nmol : int
-        number of molecules
+    s : float
+        scale factor of the box lengths
+
+    Returns
+    -------
+    u, u12 : floats
+        total energy and its r^-12 part in the scaled box
+
+    """
+    u12 = self.tu12*s**-12.
+    return u12 + (self.tu - self.tu12)*s**-6., u12
+
+  def setverlet(self,skin,parts):
+    """Switch on Verlet neighbor lists, call after setparameters
+
+    Parameters
+    ----------
+    skin : float
+        extra distance beyond the cutoff kept in the lists
+    parts : class
+        particle store, see particles.py
+
+    """
+    self.verlet = verletlist(self.box, self.rc, skin, parts)
+    self.verlet.build()
+
+  def calcforces(self,parts,calcenergy=False):
+    """Calculate the forces, virial and (if self.calctensor) the virial tensor
+    Works on whole blocks of pairs at a time
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    calcenergy : bool
+        also sum the total energy over the same pairs, this resets the
+        running total self.tu
 
     """
+    nmol = parts.nmol
     self.f = np.zeros((nmol,self.ndim))
-    r = np.zeros((3))
-    for imol in range(0,nmol-1):
-      for jmol in range(imol+1,nmol):
-        for idim in range(self.ndim):
-          r[idim] = pos[imol,idim] - pos[jmol,idim]
-        self.box.applypbc(r)
-        r2 = 0.0
-        for idim in range(self.ndim):
-          r2 += r[idim]**2.0
-        if r2 < self.rc2:
-          r6 = r2**3.
-          r12 = r6*r6
-          tf = (self.fprea/r12 - self.fpreb/r6)/r2*r
-          self.f[imol,:] += tf
-          self.f[jmol,:] -= tf
-          self.vir += np.dot(r, tf)
-          if self.calctensor:
-            for idim in range(self.ndim):
-              for jdim in range(self.ndim):
-                self.virtensor[idim,jdim] += r[idim] * tf[jdim]
-
-  def calcvirial(self, pos, nmol):
+    u = 0.0
+    u12 = 0.0
+    for imol, jmol, r, r2 in self.pairs(parts):
+      # force on imol from jmol is ff*r
+      ptype = self.pairtype(parts, imol, jmol)
+      ff = self.pairforce(r2, ptype)
+      tf = ff[:,np.newaxis]*r
+      for idim in range(self.ndim):
+        self.f[:,idim] += np.bincount(imol, tf[:,idim], nmol) - np.bincount(jmol, tf[:,idim], nmol)
+      self.vir += np.dot(ff, r2)
+      if self.calctensor:
+        self.virtensor += np.dot(r.T, tf)
+      if calcenergy:
+        u += np.sum(self.pairenergy(r2, ptype))
+        if self.splitsums:
+          u12 += np.sum(self.pot.energy12(r2, ptype))
+    self.vir = float(self.vir)
+    if calcenergy:
+      self.tu = float(u) + self.pot.utail(self.counts(parts), self.box.vol)
+      if self.splitsums:
+        self.tu12 = float(u12) + self.pot.utail12(self.counts(parts), self.box.vol)
+
+  def calcvirial(self, parts, calcenergy=False):
     """Calculate the virial pressure
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    nmol : int
-        number of molecules
+    parts : class
+        particle store, see particles.py
+    calcenergy : bool
+        also calculate the total energy in the same pass, see calcforces
 
     """
     self.vir = 0.0
     self.virtensor = np.zeros((self.ndim, self.ndim))
-    self.calcforces(pos,nmol)
+    self.calcforces(parts, calcenergy)
     self.vir /= float(self.ndim)
 
-  def calcpressure(self, pos, nmol, vol):
-    """Calculate the pressure
+  def calcpressure(self, parts, vol, calcenergy=False):
+    """Calculate the pressure, and the pressure tensor if self.calctensor
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    nmol : int
-        number of molecules
+    parts : class
+        particle store, see particles.py
     vol : float
         simulation box volume
+    calcenergy : bool
+        also calculate the total energy in the same pass, see calcforces
 
     """
-    self.calcvirial(pos, nmol)
-    rho = nmol/vol
-    p = self.T * rho + self.vir/vol
+    self.calcvirial(parts, calcenergy)
+    rho = parts.nmol/vol
+    ptail = self.pot.ptail(self.counts(parts)/vol)
+    p = self.T * rho + self.vir/vol + ptail
     self.tp = p
+    if self.calctensor:
+      self.ptensor = (self.T * rho + ptail) * np.identity(self.ndim) + self.virtensor/vol
+
+  def pairtype(self,parts,imol,jmol):
+    """Type of each pair of a mixture, see potential.py
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    imol, jmol : 1d int arrays
+        molecule numbers of each pair
+
+    Returns
+    -------
+    ptype : 1d int array
+        species[imol]*nspecies + species[jmol], None for one species
+
+    """
+    if self.nspecies == 1:
+      return None
+    species = parts.cache['species']
+    return species.take(imol)*self.nspecies + species.take(jmol)
+
+  def counts(self,parts):
+    """Number of molecules for the tail corrections, of each species for a mixture"""
+    if self.nspecies == 1:
+      return parts.nmol
+    return parts.nmolspecies
+
+  def pairenergy(self,r2,ptype=None):
+    """Pair potential energy of a batch of pairs, see potential.py
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations
+    ptype : 1d int array
+        type of each pair, see pairtype
+
+    Returns
+    -------
+    u : 1d numpy array
+        energy of each pair
+
+    """
+    return self.pot.energy(r2, ptype)
+
+  def pairforce(self,r2,ptype=None):
+    """Pair potential force over distance of a batch of pairs, see potential.py
+    The force on molecule i from j is pairforce(r2)*(pos[i] - pos[j])
 
-  def calcfullenergy(self,pos,nmol):
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations
+    ptype : 1d int array
+        type of each pair, see pairtype
+
+    Returns
+    -------
+    ff : 1d numpy array
+        force divided by separation of each pair
+
+    """
+    return self.pot.force(r2, ptype)
+
+  def pairs(self,parts,rc2=None):
+    """Generate all molecule pairs within the cutoff
+    The pairs are produced in blocks so memory stays bounded for large nmol,
+    taken from the Verlet lists when they are switched on
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    rc2 : float
+        squared cutoff, defaults to self.rc2
+
+    Yields
+    ------
+    imol, jmol : 1d int arrays
+        molecule numbers of each pair, imol < jmol
+    r : 2d numpy array (npair, ndim)
+        minimum image separation pos[imol] - pos[jmol]
+    r2 : 1d numpy array
+        squared separation
+
+    """
+    pos = parts.pos
+    nmol = parts.nmol
+    if rc2 is None:
+      rc2 = self.rc2
+    if self.verlet is not None and rc2 <= self.rc2:
+      ilist, jlist = self.verlet.pairs()
+      self.npaircount += len(ilist)
+      for istart in range(0, len(ilist), self.pairblock):
+        imol = ilist[istart:istart+self.pairblock]
+        jmol = jlist[istart:istart+self.pairblock]
+        r = pos[imol,:] - pos[jmol,:]
+        self.box.minimage(r)
+        r2 = np.einsum('ij,ij->i', r, r)
+        mask = r2 < rc2
+        yield imol[mask], jmol[mask], r[mask], r2[mask]
+      return
+    self.npaircount += nmol*(nmol-1)//2
+    nrow = max(1, self.pairblock // max(nmol, 1))
+    for istart in range(0, nmol-1, nrow):
+      iend = min(istart+nrow, nmol-1)
+      r = pos[istart:iend,np.newaxis,:] - pos[np.newaxis,istart:nmol,:]
+      self.box.minimage(r)
+      r2 = np.einsum('ijk,ijk->ij', r, r)
+      # only keep j > i
+      mask = np.arange(nmol-istart) > np.arange(iend-istart)[:,np.newaxis]
+      mask &= r2 < rc2
+      ii, jj = np.nonzero(mask)
+      yield ii + istart, jj + istart, r[ii,jj], r2[ii,jj]
+
+  def calcfullenergy(self,parts):
     """Calculate the system, looping over all molecules
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    nmol : int
-        number of molecules
+    parts : class
+        particle store, see particles.py
+
+    """
+    self.tu = 0.0
+    self.tu12 = 0.0
+    for imol, jmol, r, r2 in self.pairs(parts):
+      ptype = self.pairtype(parts, imol, jmol)
+      self.tu += np.sum(self.pairenergy(r2, ptype))
+      if self.splitsums:
+        self.tu12 += np.sum(self.pot.energy12(r2, ptype))
+    self.tu = float(self.tu) + self.pot.utail(self.counts(parts), self.box.vol)
+    if self.splitsums:
+      self.tu12 = float(self.tu12) + self.pot.utail12(self.counts(parts), self.box.vol)
+
+  def resettotal(self,u,u12=0.0):
+    """Replace the running total by a recomputed one, e.g. at a sample
+    The error it had is kept for the next drift check, so the drift is
+    reported from one check to the next however often the samples reset it
+
+    Parameters
+    ----------
+    u : float
+        recomputed total energy
+    u12 : float
+        its r^-12 part, used with splitsums
 
     """
-    self.tu = 0
-    r = np.zeros((3))
-    for imol in range(0,nmol-1):
-      for jmol in range(imol+1,nmol):
-        for idim in range(self.ndim):
-          r[idim] = pos[imol,idim] - pos[jmol,idim]
-        self.box.applypbc(r)
-        r2 = 0.0
-        for idim in range(self.ndim):
-          r2 += r[idim]**2.0
+    self.absorbed += self.tu - u
+    self.tu = u
+    if self.splitsums:
+      self.tu12 = u12
 
-        if r2 < self.rc2:
-          r6 = r2**3.
-          r12 = r6*r6
-          self.tu += self.a/r12 - self.b/r6
+  def checkdrift(self,parts,istep):
+    """Recompute the total energy and record how far the running total drifted
+    The running total is reset to the recomputed value, the error taken
+    out by samples since the last check is added back, see resettotal
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    istep : int
+        MC move number
+
+    Returns
+    -------
+    error : float
+        running total minus recomputed energy
+
+    """
+    urun = self.tu + self.absorbed
+    self.absorbed = 0.0
+    self.calcfullenergy(parts)
+    self.drift.append((istep, urun, self.tu))
+    return urun - self.tu
 
-  def calcenergy(self,pos,mmol,nmol):
+  def getstate(self):
+    """Running total energy, cutoff and drift history, e.g. for a checkpoint"""
+    return {'tu': self.tu, 'tu12': self.tu12, 'rc': self.rc, 'absorbed': self.absorbed,
+            'drift': np.array(self.drift).reshape((-1,3))}
+
+  def setstate(self,state):
+    """Restore from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.tu = float(state['tu'])
+    self.tu12 = float(state['tu12'])
+    self.absorbed = float(state['absorbed'])
+    if float(state['rc']) != self.rc:
+      self.setcutoff(float(state['rc']))
+    self.drift = [(int(row[0]), row[1], row[2]) for row in np.asarray(state['drift']).tolist()]
+
+  def outputdrift(self, fname='mc'):
+    """Output the running total energy error found at each drift check
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning
+
+    """
+    driftfile = open(fname + '.drift', 'w')
+    driftfile.write('# step U_running U_full error\n')
+    for istep, urun, ufull in self.drift:
+      driftfile.write('%d %f %f %e\n' % (istep, urun, ufull, urun - ufull))
+    driftfile.close()
+
+  def calcenergy(self,parts,mmol,mpos=None,species=None):
     """Calculate the energy of test molecules
+    Only the Verlet list of mmol is visited when it still covers its position,
+    otherwise only the neighboring cells if the box has a cell list.
+    With tail corrections the energy includes the change of the tail
+    energy from adding the molecule (mmol == nmol) or removing it
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
+    parts : class
+        particle store, see particles.py
     mmol : int
-        test molecule number
-    nmol : int
-        number of molecules
+        test molecule number, molecule mmol in the store is skipped
+    mpos : 1d numpy array with length ndim
+        (trial) position of the test molecule, defaults to its stored position
+    species : int
+        species of the test molecule of a mixture, defaults to the stored one
 
     """
-    mollist = [*range(0,mmol),*range(mmol+1,nmol)]
-    mpos = pos[mmol,:]
-    e = 0.0
-    r = np.zeros((3))
-    for imol in mollist:
-      for idim in range(self.ndim):
-        r[idim] = pos[imol,idim] - mpos[idim]
-      self.box.applypbc(r)
-      r2 = 0.0
-      for idim in range(self.ndim):
-        r2 += r[idim]**2.0
+    pos = parts.pos
+    nmol = parts.nmol
+    if mpos is None:
+      mpos = pos[mmol,:]
+    if self.verlet is not None and mmol < nmol and self.verlet.valid(mmol, mpos):
+      jmol = self.verlet.candidates(mmol)
+    elif self.box.cells is not None:
+      # only molecules in the surrounding cells can be within the cutoff
+      jmol = self.box.cells.candidates(mpos)
+    else:
+      jmol = None
 
-      if r2 < self.rc2:
-        r6 = r2**3.
-        r12 = r6*r6
-        e += self.a/r12 - self.b/r6
+    if jmol is None:
+      r = pos[:nmol,:] - mpos
+      self.box.minimage(r)
+      r2 = np.einsum('ij,ij->i', r, r)
+      mask = r2 < self.rc2
+      if mmol < nmol:
+        mask[mmol] = False
+    else:
+      r = pos[jmol,:] - mpos
+      self.box.minimage(r)
+      r2 = np.einsum('ij,ij->i', r, r)
+      mask = (r2 < self.rc2) & (jmol != mmol)
+    self.npaircount += len(mask)
+    r2 = r2[mask]
+    ptype = None
+    if self.nspecies == 1:
+      n = max(nmol, mmol+1)
+    else:
+      if species is None:
+        species = parts.cache['species'][mmol]
+      ptype = species*self.nspecies + parts.cache['species'].take(np.nonzero(mask)[0] if jmol is None else jmol[mask])
+      n = parts.nmolspecies.copy()
+      if mmol >= nmol:
+        n[species] += 1
+    u = float(np.sum(self.pairenergy(r2, ptype)))
+    if self.pot.tail:
+      u += self.pot.utailsingle(n, self.box.vol, species)
+    if self.splitsums:
+      self.u12 = float(np.sum(self.pot.energy12(r2, ptype)))
+      if self.pot.tail:
+        self.u12 += self.pot.utailsingle12(n, self.box.vol, species)
+    return u
 
-    return e
+  def calcinsertion(self,parts,tpos,species=0):
+    """Energies of many test molecules, each inserted on its own
+    The separations are computed in blocks of self.pairblock
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    tpos : 2d numpy array (ntest, ndim)
+        positions of the test molecules
+    species : int
+        species of the test molecules of a mixture
+
+    Returns
+    -------
+    u : 1d numpy array
+        energy of inserting each test molecule, tail change included
+
+    """
+    pos = parts.pos
+    nmol = parts.nmol
+    ntest = len(tpos)
+    self.npaircount += ntest*nmol
+    u = np.zeros((ntest))
+    nrow = max(1, self.pairblock // max(nmol, 1))
+    for istart in range(0, ntest, nrow):
+      iend = min(istart+nrow, ntest)
+      r = pos[np.newaxis,:nmol,:] - tpos[istart:iend,np.newaxis,:]
+      self.box.minimage(r)
+      r2 = np.einsum('ijk,ijk->ij', r, r)
+      ii, jj = np.nonzero(r2 < self.rc2)
+      ptype = None
+      if self.nspecies > 1:
+        ptype = species*self.nspecies + parts.cache['species'].take(jj)
+      u[istart:iend] = np.bincount(ii, self.pairenergy(r2[ii,jj], ptype), iend-istart)
+    if self.pot.tail:
+      if self.nspecies == 1:
+        u += self.pot.utailsingle(nmol+1, self.box.vol)
+      else:
+        n = parts.nmolspecies.copy()
+        n[species] += 1
+        u += self.pot.utailsingle(n, self.box.vol, species)
+    return u
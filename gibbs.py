@@ -0,0 +1,248 @@
+# Gibbs ensemble driver for vapor-liquid coexistence with the monte carlo code
+import sys, copy
+import math as ma
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from input import inputs
+from main_mc import commandline
+from rng import rng
+from simulation import simulation
+
+class gibbs(object):
+  def __init__(self,inp,fracswap=0.1,fracvolume=None,nthreads=1):
+    """Initiate Gibbs ensemble driver
+    Two boxes at the same temperature exchange molecules and volume, the
+    total N and V are fixed. Each box is a simulation of its own, with its
+    own random stream spawned from inp.seed, and writes its own output
+    files (fname_box1, fname_box2) with the densities and energies
+
+    Parameters
+    ----------
+    inp : class
+       simulation inputs of each box at the start, see input.py
+    fracswap : float
+        fraction of moves that transfer a molecule between the boxes
+    fracvolume : float
+        fraction of moves that exchange volume, defaults to one per
+        sweep of all molecules
+    nthreads : int
+        threads for the whole-box passes (drift checks and samples) of the
+        two boxes, 1 for none. The single-molecule moves stay serial, they
+        are too short to gain from threads. The speedup has only been
+        measured on one core, where the passes still overlap their output
+
+    self.nattempt : 1d array
+        attempted transfers from box 1 to 2, from 2 to 1 and volume exchanges
+    self.naccept : 1d array
+        accepted transfers and volume exchanges
+
+    """
+    if inp.potential != 'truncated':
+      raise ValueError('volume exchanges scale the cutoff, which changes the %s potential' % inp.potential)
+    self.inp = inp
+    seeds = rng(inp.seed).spawn(3)
+    # the last stream picks the moves
+    self.rng = rng(seeds[-1])
+    self.sims = []
+    for ibox in range(2):
+      binp = copy.deepcopy(inp)
+      binp.seed = seeds[ibox]
+      binp.fname = '%s_box%d' % (inp.fname, ibox + 1)
+      binp.gibbs = True
+      binp.NVT = False
+      binp.muVT = False
+      binp.NPT = False
+      binp.frac_displacement = 1.0
+      binp.frac_insdel = 0.0
+      self.sims.append(simulation(binp))
+    self.fracswap = fracswap
+    if fracvolume is None:
+      fracvolume = 1./(2*inp.nmol + 1)
+    self.fracvolume = fracvolume
+    self.beta = 1./inp.T
+    self.dlnv = inp.dlnv
+    self.tunestart = (0, 0)
+    self.nattempt = np.zeros((3))
+    self.naccept = np.zeros((3))
+    self.pool = ThreadPoolExecutor(nthreads) if nthreads > 1 else None
+
+  def both(self,func):
+    """Call func(sim) for each box, in parallel threads if nthreads > 1
+    The boxes share no state, so the results do not depend on the threads
+
+    Parameters
+    ----------
+    func : function
+        called as func(sim)
+
+    """
+    if self.pool is None:
+      for sim in self.sims:
+        func(sim)
+    else:
+      for future in [self.pool.submit(func, sim) for sim in self.sims]:
+        future.result()
+
+  def run(self):
+    """Do the MC moves of both boxes, sampling along the way"""
+    inp = self.inp
+    for imove in range(inp.nmoves):
+      tfrac = self.rng.random()
+      if tfrac < self.fracvolume:
+        self.volumemove()
+      elif tfrac < self.fracvolume + self.fracswap:
+        self.swapmove()
+      else:
+        # a random molecule of either box
+        nmol = [sim.mv.nmol for sim in self.sims]
+        ibox = 0 if self.rng.random()*(nmol[0] + nmol[1]) < nmol[0] else 1
+        self.sims[ibox].mv.move()
+      if imove < inp.nmovesequil:
+        for sim in self.sims:
+          sim.mv.tune(imove)
+        self.tune(imove)
+      if inp.ndriftcheck > 0 and ((imove+1) % inp.ndriftcheck) == 0:
+        self.both(lambda sim: sim.en.checkdrift(sim.parts, imove))
+      if (imove % inp.nsample) == 0 and (imove > inp.nmovesequil):
+        self.both(lambda sim: sim.sample(imove))
+
+  def swapmove(self):
+    """Transfer a random molecule from one box to a random place in the other
+    Accepted with min(1, N_out V_in/((N_in+1) V_out) exp(-beta dU))
+    """
+    iout = self.rng.randint(2)
+    out = self.sims[iout]
+    into = self.sims[1 - iout]
+    self.nattempt[iout] += 1
+    if out.mv.nmol == 0:
+      return
+    im = out.rng.randint(out.mv.nmol)
+    # a molecule of a mixture keeps its species
+    species = out.parts.cache['species'][im] if out.parts.nspecies > 1 else None
+    trial, tnm = into.mv.insert(species)
+    oldenergy = out.en.calcenergy(out.parts, im)
+    oldenergy12 = out.en.u12
+    newenergy = into.en.calcenergy(into.parts, tnm, trial, species)
+    newenergy12 = into.en.u12
+    try:
+      metrop = ma.exp(-self.beta*(newenergy - oldenergy))
+    except OverflowError:
+      metrop = float('inf')
+    metrop *= out.mv.nmol*into.mv.vol/((into.mv.nmol + 1)*out.mv.vol)
+    # cavity bias on either side, see moves.setcavity; a removal that
+    # leaves no cavity could not be undone and is rejected
+    if into.mv.cavity is not None:
+      metrop *= into.mv.biasfactor
+    if out.mv.cavity is not None:
+      vcav = out.mv.cavity.removal(out.parts.pos[im,:])/out.mv.vol
+      metrop = metrop/vcav if vcav > 0 else 0.
+    if self.rng.random() < metrop:
+      out.mv.delete(im)
+      into.mv.place(tnm, trial)
+      out.en.tu -= oldenergy
+      into.en.tu += newenergy
+      out.en.tu12 -= oldenergy12
+      into.en.tu12 += newenergy12
+      self.naccept[iout] += 1
+
+  def volumemove(self):
+    """Move volume from one box to the other
+    A random step in ln(V1/V2) at fixed V1 + V2, accepted with
+      min(1, exp(-beta dU + sum_i (N_i+1) ln(V_i'/V_i)))
+    and the energies follow from scaling, see energy.rescale
+    """
+    vol = np.array([sim.mv.vol for sim in self.sims])
+    lnratio = ma.log(vol[0]/vol[1]) + self.rng.uniform(-self.dlnv, self.dlnv)
+    newvol = np.zeros((2))
+    newvol[0] = np.sum(vol)/(1. + ma.exp(-lnratio))
+    newvol[1] = np.sum(vol) - newvol[0]
+    s = (newvol/vol)**(1./self.sims[0].bx.ndim)
+    arg = 0.
+    energies = []
+    for ibox, sim in enumerate(self.sims):
+      newenergy, newenergy12 = sim.en.rescale(s[ibox])
+      energies.append((newenergy, newenergy12))
+      arg += -self.beta*(newenergy - sim.en.tu) + (sim.mv.nmol + 1)*ma.log(newvol[ibox]/vol[ibox])
+    self.nattempt[2] += 1
+    if self.rng.random() < ma.exp(min(arg, 0.)):
+      for sim, si, (newenergy, newenergy12) in zip(self.sims, s, energies):
+        sim.mv.resize(sim.bx.boxlength*si)
+        sim.en.tu = newenergy
+        sim.en.tu12 = newenergy12
+      self.naccept[2] += 1
+
+  def tune(self,imove,targetaccept=None,ntune=50):
+    """Adjust dlnv toward the target acceptance ratio of volume exchanges, see moves.tune
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+    targetaccept : float
+        defaults to inp.targetaccept, 0 for no tuning
+    ntune : int
+        volume exchanges between adjustments of dlnv
+
+    """
+    if targetaccept is None:
+      targetaccept = self.inp.targetaccept
+    if targetaccept <= 0:
+      return
+    nattempt = self.nattempt[2] - self.tunestart[0]
+    if nattempt < ntune:
+      return
+    ratio = (self.naccept[2] - self.tunestart[1])/float(nattempt)
+    self.dlnv *= min(max(ratio/targetaccept, 0.5), 2.)
+    self.tunestart = (self.nattempt[2], self.naccept[2])
+
+  def finish(self):
+    """Write the output of both boxes and the coexistence summary"""
+    for sim in self.sims:
+      sim.finish()
+    if self.pool is not None:
+      self.pool.shutdown()
+    self.outputgibbs(self.inp.fname)
+
+  def outputgibbs(self, fname='mc'):
+    """Output the density and energy per molecule of both boxes and the move acceptance
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning
+
+    """
+    gibbsfile = open(fname + '.gibbs', 'w')
+    gibbsfile.write('# box rho rho_err U/N N V P P_err\n')
+    for ibox, sim in enumerate(self.sims):
+      io = sim.io
+      gibbsfile.write('%d %f %f %f %f %f %f %f\n' % (ibox + 1, io.rhoave, io.rhoerr,
+                      io.uave/io.nave if io.nave > 0 else 0., io.nave, io.vave, io.pave, io.perr))
+    gibbsfile.write('# move attempts accepted fa\n')
+    for imovetype, movetype in enumerate(['swap_1to2', 'swap_2to1', 'volume']):
+      nattempt = self.nattempt[imovetype]
+      ratio = self.naccept[imovetype]/float(nattempt) if nattempt > 0 else 0
+      gibbsfile.write('%s %d %d %f\n' % (movetype, nattempt, self.naccept[imovetype], ratio))
+    gibbsfile.write('# dlnv %f\n' % self.dlnv)
+    gibbsfile.close()
+
+def main(argv=None):
+  parser = commandline('Gibbs ensemble MC, -V and -N are those of each box at the start')
+  parser.add_argument("--fracswap", type=float, default=0.1,
+                 help='fraction of moves that transfer a molecule between the boxes')
+  parser.add_argument("--fracvolume", type=float, default=None,
+                 help='fraction of moves that exchange volume, one per sweep by default')
+  parser.add_argument("--threads", type=int, default=1,
+                 help='threads for the drift checks and samples of the two boxes, 1 for none')
+  inp = inputs()
+  inp.readcommandline(parser)
+  args = parser.parse_args()
+  if inp.potential != 'truncated':
+    # volume exchanges scale the cutoff with the box, see gibbs.volumemove
+    parser.error('the Gibbs ensemble is only available for --potential truncated')
+  ge = gibbs(inp, args.fracswap, args.fracvolume, args.threads)
+  ge.run()
+  ge.finish()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,10 @@
+def perspecies(value):
+  """Read a float, or a list of floats with one value per species separated by ':'"""
+  values = [float(x) for x in value.split(':')]
+  if len(values) == 1:
+    return values[0]
+  return values
+
 class inputs(object):
   def __init__(self):
     """Simulation inputs
@@ -7,6 +14,9 @@ class inputs(object):
     self.mu = 0.1
     self.NVT = True
     self.muVT = False
+    self.NPT = False
+    self.gibbs = False # one of the two boxes of a Gibbs ensemble run, see gibbs.py
+    self.P = 1. # pressure of NPT runs
 
     self.boxlength = [10., 10., 10.]
     self.ndim = len(self.boxlength)
@@ -25,6 +35,10 @@ class inputs(object):
     self.nmoves = 20000
     self.nmovesequil = 10000
     self.nsample = 50
+    self.ndriftcheck = 5000 # moves between full energy recalculations, 0 for none
+    self.nrdfbins = 100 # g(r) histogram bins up to the cutoff
+    self.onlinestats = False # keep only running statistics of the samples
+    self.nwidom = 0 # Widom test insertions per sample, 0 for none
 
     # Move mixture
     if self.NVT:
@@ -34,35 +48,64 @@ class inputs(object):
       self.frac_displacement = 0.6
       self.frac_insdel = 0.4
 
+    # translation step, tuned during equilibration toward the target
+    # acceptance; maxdisp 0 moves molecules anywhere in the box
+    self.maxdisp = 0.5
+    self.targetaccept = 0.4
+    self.rcavity = 0. # cavity radius of biased insertion, 0 for uniform insertion
+    self.dlnv = 0.05 # largest ln V step of NPT volume moves, tuned like maxdisp
+
     self.sigma = 1.
     self.epsilon = 1.
+    # a mixture has lists of sigma, epsilon and mu with one value per species
+    self.nspecies = 1
+    self.fractions = [1.] # initial mole fraction of each species
+    self.mixing = 'lb' # lb (Lorentz-Berthelot) or geometric for unlike pairs
+    self.overrides = None # {(i, j): (sigma, epsilon) or (sigma, epsilon, rc)} instead of mixing
+    self.potential = 'truncated' # truncated (with tail corrections), shifted or forceshifted
+    self.tabletol = 0. # accuracy of the potential tables, 0 for the analytic potential
+
+    self.usecells = False # cell list neighbor search
+    self.skin = 0. # Verlet list skin, 0 for no Verlet lists
 
     self.make_movie = False
+    self.writeconfigs = True # configurations to the trajectory every sample
+    self.configformat = 'float32' # binary .traj precision (float32, float64) or xyz
     self.fname = 'mc'
+    self.seed = None # random seed, None for a different run every time
+    self.ncheckpoint = 0 # moves between checkpoints, 0 for none
+    self.restart = False # continue from the checkpoint
+    self.profile = False # time the phases of the run, written to .perf
+    self.nprogress = 0 # moves between progress lines, 0 for none
 
-  def readcommandline(self,parser):
+  def readcommandline(self,parser,args=None):
     """Read command line information to override the defaults
 
     Parameters
     ----------
     parser : an ArgParser.parser
         Carries command-line information
+    args : an argparse.Namespace
+        already parsed (and possibly modified) arguments, parsed from
+        the command line if not given
 
     """
-    if parser.parse_args().V != 'read':
-      V = float(parser.parse_args().V)
+    if args is None:
+      args = parser.parse_args()
+    if args.V != 'read':
+      V = float(args.V)
       v3 = V**(1./3.)
       self.boxlength  = [v3, v3, v3]
       self.rc = min(self.boxlength)/2.
-    if parser.parse_args().N != 'read':
-      self.nmol = int(parser.parse_args().N)
+    if args.N != 'read':
+      self.nmol = int(args.N)
       self.max_nmol = self.nmol # needed for muVT
       self.frac_displacement = 1.0
       self.frac_insdel = 0.0
-    if parser.parse_args().temperature != 'read':
-      self.T = float(parser.parse_args().temperature)
-    if parser.parse_args().mu != 'read':
-      self.mu = float(parser.parse_args().mu)
+    if args.temperature != 'read':
+      self.T = float(args.temperature)
+    if args.mu != 'read':
+      self.mu = perspecies(args.mu)
       self.max_nmol = 10000
       self.NVT = False
       self.muVT = True
@@ -71,6 +114,86 @@ class inputs(object):
     else:
       self.muVT = True
       self.NVT = False
-    if parser.parse_args().outfile != 'read':
-      self.fname = parser.parse_args().outfile
+    if args.outfile != 'read':
+      self.fname = args.outfile
+    if args.cells:
+      self.usecells = True
+    if args.skin != 'read':
+      self.skin = float(args.skin)
+    if args.driftcheck != 'read':
+      self.ndriftcheck = int(args.driftcheck)
+    if args.seed != 'read':
+      self.seed = int(args.seed)
+    if args.maxdisp != 'read':
+      self.maxdisp = float(args.maxdisp)
+    if args.targetaccept != 'read':
+      self.targetaccept = float(args.targetaccept)
+    if args.noconfigs:
+      self.writeconfigs = False
+    if args.configformat != 'read':
+      self.configformat = args.configformat
+    if args.checkpoint != 'read':
+      self.ncheckpoint = int(args.checkpoint)
+    if args.restart:
+      self.restart = True
+    if args.online:
+      self.onlinestats = True
+    if args.profile:
+      self.profile = True
+    if args.progress != 'read':
+      self.nprogress = int(args.progress)
+    if args.potential != 'read':
+      self.potential = args.potential
+    if args.tabletol != 'read':
+      self.tabletol = float(args.tabletol)
+      if self.tabletol > 0 and self.potential != 'forceshifted':
+        # with numpy only the square root of the force-shifted form costs more than a lookup
+        parser.error('--tabletol is only faster than the analytic potential for --potential forceshifted')
+    if args.widom != 'read':
+      self.nwidom = int(args.widom)
+    if args.cavity != 'read':
+      self.rcavity = float(args.cavity)
+    if args.pressure != 'read':
+      if self.potential != 'truncated':
+        # volume moves scale the cutoff with the box, which changes the
+        # shifted forms, see energy.rescale
+        parser.error('-P is only available for --potential truncated')
+      self.P = float(args.pressure)
+      self.NPT = True
+      self.NVT = False
+      self.muVT = False
+      self.max_nmol = self.nmol
+      self.frac_displacement = 1.0
+      self.frac_insdel = 0.0
+    if args.dlnv != 'read':
+      self.dlnv = float(args.dlnv)
+    if args.sigma != 'read':
+      self.sigma = perspecies(args.sigma)
+    if args.epsilon != 'read':
+      self.epsilon = perspecies(args.epsilon)
+    if args.fractions != 'read':
+      self.fractions = perspecies(args.fractions)
+    if args.mixing != 'read':
+      self.mixing = args.mixing
+    if args.override != 'read':
+      self.overrides = {}
+      for override in args.override.split(','):
+        values = override.split(':')
+        self.overrides[(int(values[0]), int(values[1]))] = tuple([float(x) for x in values[2:]])
+    # one value for all species of a mixture
+    for values in [self.sigma, self.epsilon, self.fractions, self.mu]:
+      if isinstance(values, list):
+        self.nspecies = max(self.nspecies, len(values))
+    if self.nspecies > 1:
+      if not isinstance(self.sigma, list):
+        self.sigma = [self.sigma]*self.nspecies
+      if not isinstance(self.epsilon, list):
+        self.epsilon = [self.epsilon]*self.nspecies
+      if not isinstance(self.fractions, list):
+        self.fractions = [1.]*self.nspecies
+      if not isinstance(self.mu, list):
+        self.mu = [self.mu]*self.nspecies
+      if self.tabletol > 0:
+        # checked here, before any output file is opened
+        parser.error('--tabletol is only available for one species, see potential.tabulate')
 
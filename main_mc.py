@@ -1,63 +1,23 @@
 # python code for monte carlo simulations
 import sys, argparse
 import numpy as np
-from box import box
-from configs import configfile
-from configs import initialize
-from configs import movie
-from energy import energy
 from input import inputs
-from moves import moves
-from tally import tally
+from simulation import simulation
 
 def run(parser):
 #def run(parser=argparse.ArgumentParser()):
   inp = inputs()
   inp.readcommandline(parser)
   
-  bx = box()
-  bx.setedges(inp.boxlength)
-  
-  en = energy(inp.nmol, bx, inp.T)
-  en.setparameters(inp.sigma,inp.epsilon,inp.rc)
-  
-  if inp.muVT:
-    init = initialize(inp.max_nmol)
-  else:
-    init = initialize(inp.nmol)
-  pos, exist = init.random(inp.nmol, bx)
-  
-  # Set up move
-  mv = moves(inp.nmol,bx,en,inp.T,inp.mu)
-  mv.setmovemix(inp.frac_displacement,inp.frac_insdel)
-  
-  if inp.make_movie:
-    mov = movie(inp.sigma,bx)
-    mov.update(pos,exist)
-  
-  config = configfile(inp.ndim, inp.fname)
-  io = tally(inp.fname)
-  
-  for imove in range(inp.nmoves):
-    mv.move(pos, exist)
-    if (imove % inp.nsample) == 0 and (imove > inp.nmovesequil):
-      en.calcpressure(pos, mv.nmol, mv.vol)
-      en.calcfullenergy(pos, mv.nmol)
-      config.writeframe(imove, pos, mv.nmol)
-      io.update(imove, en, mv)
-  
-  if inp.make_movie:
-    mov.update(pos, exist)
-  io.average()
-  # io.pltseries()
-  if inp.muVT:
-    io.outputave(inp.T, inp.fname,inp.mu)
-  else:
-    io.outputave(inp.T, inp.fname)
-  mv.outputefficiency(inp.fname)
+  sim = simulation(inp)
+  start = 0
+  if inp.restart:
+    start = sim.restart()
+  sim.run(start)
+  sim.finish()
 
-def main(argv=None):
-  parser = argparse.ArgumentParser(description='Simple MC code')
+def commandline(description='Simple MC code'):
+  parser = argparse.ArgumentParser(description=description)
   parser.add_argument("-V", type=str, default='read',
                  help='volume, assumes')
   parser.add_argument("-N", type=str, default='read',
@@ -65,10 +25,63 @@ def main(argv=None):
   parser.add_argument('-T', "--temperature", type=str, default='read',
                  help='Temperature')
   parser.add_argument("--mu", type=str, default='read',
-                 help='chemical potential')
+                 help='chemical potential, one per species separated by : for a mixture')
   parser.add_argument("--outfile", type=str, default='read',
                  help='output file name root')
+  parser.add_argument("--cells", action='store_true',
+                 help='use a cell list for single-molecule energies')
+  parser.add_argument("--skin", type=str, default='read',
+                 help='Verlet list skin distance, off if not given')
+  parser.add_argument("--driftcheck", type=str, default='read',
+                 help='moves between full energy recalculations, 0 for none')
+  parser.add_argument("--seed", type=str, default='read',
+                 help='random seed, runs with the same seed are identical')
+  parser.add_argument("--maxdisp", type=str, default='read',
+                 help='largest translation step, 0 moves molecules anywhere in the box')
+  parser.add_argument("--targetaccept", type=str, default='read',
+                 help='translation acceptance the step is tuned to in equilibration, 0 for no tuning')
+  parser.add_argument("--noconfigs", action='store_true',
+                 help='do not write the configurations, g(r) is still written to the .rdf file')
+  parser.add_argument("--configformat", type=str, default='read',
+                 choices=['read', 'float32', 'float64', 'xyz'],
+                 help='binary .traj precision or text xyz for the configurations')
+  parser.add_argument("--checkpoint", type=str, default='read',
+                 help='moves between checkpoints of the full state to the .chk file')
+  parser.add_argument("--restart", action='store_true',
+                 help='continue from the .chk file, give the same options as the first run')
+  parser.add_argument("--online", action='store_true',
+                 help='keep running statistics instead of every sample, for very long runs')
+  parser.add_argument("--profile", action='store_true',
+                 help='time the phases of the run and write them to the .perf file')
+  parser.add_argument("--progress", type=str, default='read',
+                 help='moves between progress lines with moves/second')
+  parser.add_argument("--potential", type=str, default='read',
+                 choices=['read', 'truncated', 'shifted', 'forceshifted'],
+                 help='cutoff treatment, truncated has long-range tail corrections')
+  parser.add_argument("--tabletol", type=str, default='read',
+                 help='use interpolation tables of the forceshifted potential with this relative accuracy')
+  parser.add_argument("--widom", type=str, default='read',
+                 help='Widom test insertions per sample for the excess chemical potential')
+  parser.add_argument("--cavity", type=str, default='read',
+                 help='cavity radius for cavity-biased insertion and deletion, off if not given')
+  parser.add_argument('-P', "--pressure", type=str, default='read',
+                 help='pressure, runs NPT with log-volume moves')
+  parser.add_argument("--dlnv", type=str, default='read',
+                 help='largest ln V step of a volume move')
+  parser.add_argument("--sigma", type=str, default='read',
+                 help='LJ sigma, one per species separated by : for a mixture')
+  parser.add_argument("--epsilon", type=str, default='read',
+                 help='LJ epsilon, one per species separated by : for a mixture')
+  parser.add_argument("--fractions", type=str, default='read',
+                 help='initial mole fractions of the species separated by :')
+  parser.add_argument("--mixing", type=str, default='read', choices=['read', 'lb', 'geometric'],
+                 help='mixing rule of unlike pairs, Lorentz-Berthelot by default')
+  parser.add_argument("--override", type=str, default='read',
+                 help='i:j:sigma:epsilon[:rc] of pairs of species instead of the mixing rule, comma separated')
+  return parser
 
+def main(argv=None):
+  parser = commandline()
   run(parser)
 
 if __name__ == '__main__':
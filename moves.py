@@ -1,14 +1,15 @@
 import math as ma
 import numpy as np
-import random as rand
+from rng import rng
+from neighbors import cavitygrid
 class moves(object):
-  def __init__(self,n,box,energy,temp, mu):
+  def __init__(self,parts,box,energy,temp, mu, stream=None):
     """Initiate moves class
 
     Parameters
     ----------
-    n : int
-        number of molecules
+    parts : class
+        particle store, see particles.py
     box : class
        simulation box parameter information, see box.py
     energy : class
@@ -17,8 +18,10 @@ class moves(object):
        move routine and information, see moves.py
     temp : float
         temperature
-    mu : float
-        chemical potential
+    mu : float or list of floats
+        chemical potential, one per species for a mixture
+    stream : class
+        random number stream of the run, see rng.py
 
     self.nattempt : 1d array 
         number of attempted moves of each type
@@ -29,9 +32,11 @@ class moves(object):
         0 : displacement
         1 : insertion
         2 : deletion
+        3 : volume change, see volumemove
 
     """
-    self.nmol = n
+    self.parts = parts
+    self.rng = stream if stream is not None else rng()
     self.box = box
     self.ndim = box.ndim
     self.vol = box.vol
@@ -39,10 +44,30 @@ class moves(object):
     self.energy = energy
     self.beta = 1./float(temp)
     self.mu = mu
-    self.expbetamu = ma.exp(self.beta*self.mu)
-    self.nmovetypes = 3
+    # a mixture inserts a random species and deletes a random molecule,
+    # expbetamu is that of the species being inserted or deleted
+    self.nspecies = parts.nspecies
+    self.species = 0
+    self.expbetamus = [ma.exp(self.beta*value) for value in np.ravel(mu)]
+    self.expbetamu = self.expbetamus[0]
+    self.nmovetypes = 4
     self.nattempt = np.zeros((self.nmovetypes))
     self.naccept = np.zeros((self.nmovetypes))
+    # trial position of the molecule being moved or inserted
+    self.trial = np.zeros((self.ndim))
+    # largest displacement step in each direction, 0 moves anywhere in the box
+    self.maxdisp = 0.
+    self.targetaccept = 0.
+    self.tunehistory = []
+    # cavity-biased insertion and deletion, see setcavity
+    self.cavity = None
+    self.biasfactor = 1.
+    self.cavfrac = 0.
+    # log-volume moves at constant pressure, see setvolume
+    self.pressure = None
+    self.dlnv = 0.
+    self.volumestart = (0, 0)
+    self.volumehistory = []
 
   def setmovemix(self,displace,insdel):
     """Set up the move probability and mixes
@@ -65,83 +90,158 @@ class moves(object):
         print('learnmc error: move mix fractions do not add to 1')
         sys.exit(main())    
 
-  def copypos(self, pos):
-    """Deep python copy so pos is not changed else where
+  def settranslation(self,maxdisp,targetaccept=0.,ntune=200):
+    """Set up small-step translation moves
 
     Parameters
     ----------
-    pos : 2d numpy array 
-        positions of all molecues
+    maxdisp : float
+        largest displacement in each direction, 0 to move molecules to
+        a random location anywhere in the box
+    targetaccept : float
+        displacement acceptance ratio tune() aims for, 0 for no tuning
+    ntune : int
+        displacement attempts between adjustments of maxdisp
 
     """
-    npos = np.zeros((len(pos[:,0]),self.ndim))
-    for imol in range(self.nmol):
-      for idim in range(self.ndim):
-        npos[imol,idim] = pos[imol,idim]
-    return npos
+    self.maxdisp = min(maxdisp, float(np.min(self.box.half_boxlength)))
+    self.targetaccept = targetaccept
+    self.ntune = ntune
+    self.tunestart = (self.nattempt[0], self.naccept[0])
 
-  def copyexist(self, ex):
-    """Deep python copy so the exist array is not changed else where
+  def setvolume(self,pressure,dlnv,targetaccept=0.,ntune=50):
+    """Set up log-volume moves for the NPT ensemble
+    The box is scaled isotropically with the cutoff as a fixed fraction of
+    it, so the trial energy comes from the split energy sums (see
+    energy.rescale) instead of a full recalculation
 
     Parameters
     ----------
-    ex : 1d numpy array (maxnmol length)
-        0 if in the resevoir (not in the box) 
-        1 if in the box
+    pressure : float
+        imposed pressure
+    dlnv : float
+        largest change of ln V in one move
+    targetaccept : float
+        volume acceptance ratio tune() aims for, 0 for no tuning
+    ntune : int
+        volume attempts between adjustments of dlnv
 
     """
-    nex = np.zeros((len(ex[:])))
-    for imol in range(self.nmol):
-      nex[imol] = ex[imol]
-    return nex
+    if self.energy.pot.form != 'truncated':
+      raise ValueError('volume moves scale the cutoff, which changes the %s potential' % self.energy.pot.form)
+    self.pressure = pressure
+    self.dlnv = dlnv
+    self.volumetarget = targetaccept
+    self.nvolumetune = ntune
+    self.volumestart = (self.nattempt[3], self.naccept[3])
+    # the r^-12 part of the energy is kept from the next full calculation on
+    self.energy.splitsums = True
+
+  def setcavity(self,rcav):
+    """Switch on cavity-biased insertion and deletion
+    New molecules are only tried in cavities (see neighbors.cavitygrid),
+    so the acceptance of an insertion uses the cavity volume instead of
+    the box volume, and a deletion is only allowed when it leaves a
+    cavity and uses the cavity volume after it; the ratio of the two
+    volumes is multiplied onto the unbiased acceptance
 
-  def move(self, pos, ex):
+    Parameters
+    ----------
+    rcav : float
+        cavity radius, 0 for unbiased insertion
+
+    """
+    if rcav > 0:
+      self.cavity = cavitygrid(self.box, rcav, self.parts)
+      self.cavity.build()
+    else:
+      self.cavity = None
+
+  def tune(self,imove):
+    """Adjust maxdisp toward the target acceptance ratio
+    Called every move during equilibration, only acts every ntune displacements
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+
+    """
+    if self.maxdisp <= 0 or self.targetaccept <= 0:
+      return
+    nattempt = self.nattempt[0] - self.tunestart[0]
+    if nattempt < self.ntune:
+      return
+    ratio = (self.naccept[0] - self.tunestart[1])/float(nattempt)
+    # do not change by more than a factor of 2 at a time
+    self.maxdisp *= min(max(ratio/self.targetaccept, 0.5), 2.)
+    self.maxdisp = min(self.maxdisp, float(np.min(self.box.half_boxlength)))
+    self.tunehistory.append((imove, ratio, self.maxdisp))
+    self.tunestart = (self.nattempt[0], self.naccept[0])
+
+  def tunevolume(self,imove):
+    """Adjust dlnv toward the target volume acceptance ratio, like tune
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+
+    """
+    if self.pressure is None or self.volumetarget <= 0:
+      return
+    nattempt = self.nattempt[3] - self.volumestart[0]
+    if nattempt < self.nvolumetune:
+      return
+    ratio = (self.naccept[3] - self.volumestart[1])/float(nattempt)
+    self.dlnv *= min(max(ratio/self.volumetarget, 0.5), 2.)
+    self.volumehistory.append((imove, ratio, self.dlnv))
+    self.volumestart = (self.nattempt[3], self.naccept[3])
+
+  @property
+  def nmol(self):
+    """Number of molecules in the box"""
+    return self.parts.nmol
+
+  def move(self):
     """Metropolis algorithm
     0) measure the old energy
     1) pick a random number
     2) move
     3) measure the new energy
     4) apply move-appropriate acceptance criteria
-    5) update arrays
-
-    Parameters
-    ----------
-    pos : 2d numpy array 
-        positions of all molecues
-    ex : 1d numpy array (maxnmol length)
-        0 if in the resevoir (not in the box) 
-        1 if in the box
-
+    5) update the particle store
     """
-    tfrac = rand.random()
+    tfrac = self.rng.random()
     movetype = 0 # PROJECT
 
     if movetype != 1: 
       if self.nmol == 0:
-        self.energy.tu = 0.0
         self.nattempt[movetype] += 1
         return
 
-      im = rand.randint(0,self.nmol-1)
-      oldenergy = self.energy.calcenergy(pos,im,self.nmol)
+      im = self.rng.randint(self.nmol)
+      oldenergy = self.energy.calcenergy(self.parts,im)
+      oldenergy12 = self.energy.u12
+      if movetype == 2 and self.nspecies > 1:
+        self.setspecies(self.parts.cache['species'][im])
+      if movetype == 2 and self.cavity is not None:
+        self.biasfactor = self.cavity.removal(self.parts.pos[im,:])/self.vol
+        if self.biasfactor > 0:
+          self.biasfactor = 1./self.biasfactor
     else:
       oldenergy = 0.0
+      oldenergy12 = 0.0
 
-    npos = self.copypos(pos)
-    nex = self.copyexist(ex)
-
+    # only the trial position of the moved molecule is stored,
+    # the particle store is not touched unless the move is accepted
     if movetype == 0:
-      npos[:,:] = self.displace(npos[:,:], im)
-      n_nmol = self.nmol
+      trial = self.displace(im)
     elif movetype == 1:
-      npos[:,:], nex, im = self.insert(npos, nex)
-      n_nmol = self.nmol + 1
-    elif movetype == 2:
-      npos[:,:], nex = self.delete(npos, nex, im)
-      n_nmol = self.nmol - 1
+      trial, im = self.insert()
 
     if movetype != 2:
-      newenergy = self.energy.calcenergy(npos,im,int(n_nmol))
+      newenergy = self.energy.calcenergy(self.parts,im,trial,self.species if movetype == 1 else None)
     else:
       newenergy = 0.0
     # apply metropolis criteria
@@ -156,94 +256,225 @@ class moves(object):
     if movetype == 2:
       metrop *= 1 # PROJECT
 
-    tfrac2 = rand.random()
+    if movetype != 0 and self.cavity is not None:
+      metrop = metrop*self.biasfactor if self.biasfactor > 0 else 0.
+
+    # species picked with probability 1/nspecies on insertion, while the
+    # deletion picks any molecule
+    if movetype == 1 and self.nspecies > 1:
+      metrop *= self.nspecies
+    elif movetype == 2 and self.nspecies > 1:
+      metrop /= self.nspecies
+
+    tfrac2 = self.rng.random()
     if tfrac2 < metrop:
-      for idim in range(self.ndim):
-        pos[im,idim] = npos[im,idim]
-      self.energy.tu = newenergy
+      if movetype == 2:
+        self.delete(im)
+      else:
+        self.place(im, trial)
+      # keep the running total energy
+      self.energy.tu += newenergy - oldenergy
+      if self.energy.splitsums:
+        self.energy.tu12 += (self.energy.u12 if movetype != 2 else 0.) - oldenergy12
       self.naccept[movetype] += 1
-      self.nmol = int(n_nmol)
-    else:
-      self.energy.tu = oldenergy
 
     self.nattempt[movetype] += 1
 
-  def insert(self,ipos,iexist):
-    """Insert a molecule to random location in simulation volume
+  def volumemove(self):
+    """Change the volume at constant pressure
+    A random step in ln V, accepted with
+      min(1, exp(-beta (dU + P dV) + (N+1) ln(V'/V)))
+    where the N+1 is N from scaling the positions and 1 from sampling ln V
+    """
+    oldvol = self.vol
+    newvol = oldvol*ma.exp(self.rng.uniform(-self.dlnv, self.dlnv))
+    s = (newvol/oldvol)**(1./self.ndim)
+    newenergy, newenergy12 = self.energy.rescale(s)
+    arg = (-self.beta*(newenergy - self.energy.tu + self.pressure*(newvol - oldvol))
+           + (self.nmol + 1)*ma.log(newvol/oldvol))
+    metrop = ma.exp(min(arg, 0.))
+    if self.rng.random() < metrop:
+      self.resize(self.box.boxlength*s)
+      self.energy.tu = newenergy
+      self.energy.tu12 = newenergy12
+      self.naccept[3] += 1
+    self.nattempt[3] += 1
+
+  def resize(self,edges):
+    """Scale the box to new edges, with the positions, the cutoff and
+    the neighbor structures; the energy is left to the caller
+
+    Parameters
+    ----------
+    edges : 1d numpy array with length ndim
+        new box lengths, in the same ratios as the old ones
+
+    """
+    s = edges[0]/self.box.boxlength[0]
+    self.parts.pos[:self.nmol,:] *= s
+    self.box.setedges(list(edges))
+    self.vol = self.box.vol
+    self.energy.setcutoff(self.energy.rc*s)
+    if self.box.cells is not None:
+      self.box.cells.rescale(self.energy.rc)
+    if self.energy.verlet is not None:
+      self.energy.verlet.rescale(s)
+    if self.cavity is not None:
+      self.setcavity(self.cavity.rcav)
+    self.maxdisp = min(self.maxdisp, float(np.min(self.box.half_boxlength)))
+
+  def place(self,im,trial):
+    """Put a molecule at its accepted trial position
+    The cell and Verlet lists are kept in step
+
+    Parameters
+    ----------
+    im : int
+        which molecule to move, nmol for a new molecule
+    trial : 1d numpy array with length ndim
+        new position
+
+    """
+    cells = self.box.cells
+    verlet = self.energy.verlet
+    if self.cavity is not None:
+      if im < self.nmol:
+        self.cavity.remove(self.parts.pos[im,:])
+      self.cavity.add(trial)
+    if im == self.nmol:
+      self.parts.insert(trial, self.species)
+      if cells is not None:
+        cells.insert(im, trial)
+      if verlet is not None:
+        verlet.insert(im)
+    else:
+      self.parts.pos[im,:] = trial
+      if cells is not None:
+        cells.move(im, trial)
+      if verlet is not None:
+        verlet.move(im)
+
+  def setspecies(self,species):
+    """Species of the molecule being inserted or deleted, with its expbetamu"""
+    self.species = species
+    self.expbetamu = self.expbetamus[species]
+
+  def insert(self,species=None):
+    """Pick a random location in simulation volume for a new molecule
+    With cavity bias the location is in a random cavity and
+    self.biasfactor is the cavity volume over the box volume
 
     Parameters
     ----------
-    ipos : 2d numpy array 
-        positions of all molecues
-    iex : 1d numpy array (maxnmol length)
-        0 if in the resevoir (not in the box) 
-        1 if in the box
+    species : int
+        species of the new molecule of a mixture, random if not given
 
     Returns
     -------
-    ipos : 2d numpy array 
-        new positions of all molecues
-    iex : 1d numpy array (maxnmol length)
-        new version
+    trial : 1d numpy array with length ndim
+        trial position of the new molecule
     tnm : int
-        which molecule was inserted
+        which molecule would be inserted
 
     """
     tnm = self.nmol
+    if self.nspecies > 1:
+      self.setspecies(species if species is not None else self.rng.randint(self.nspecies))
+    if self.cavity is not None:
+      pos, vcav = self.cavity.trial(self.rng)
+      self.biasfactor = vcav/self.vol
+      self.cavfrac += self.biasfactor
+      if pos is not None:
+        self.trial[:] = pos
+        return self.trial, tnm
     for idim in range(self.box.ndim):
-      ipos[tnm,idim] = rand.uniform(self.box.box[0,idim],self.box.box[1,idim])
-    iexist[tnm] = 1
-    return ipos, iexist, tnm
+      self.trial[idim] = self.rng.uniform(self.box.box[0,idim],self.box.box[1,idim])
+    return self.trial, tnm
 
-  def delete(self,delpos,delexist,im):
-    """Delete a random molecule 
+  def delete(self,im):
+    """Delete a molecule 
        Move the last molecule in the list to replace the deleted one
+       The cell and Verlet lists are kept in step
 
     Parameters
     ----------
-    delpos : 2d numpy array 
-        positions of all molecues
-    delexist : 1d numpy array (maxnmol length)
-        0 if in the resevoir (not in the box) 
-        1 if in the box
     im : int
         which molecule to delete
 
-    Returns
-    -------
-    delpos : 2d numpy array 
-        new positions of all molecues
-    delexist : 1d numpy array (maxnmol length)
-        new version
-
     """
-    tnm = self.nmol-1
+    cells = self.box.cells
+    verlet = self.energy.verlet
+    if self.cavity is not None:
+      self.cavity.remove(self.parts.pos[im,:])
+    if cells is not None:
+      cells.remove(im)
+    if verlet is not None:
+      verlet.remove(im)
     # move the one from the back to the deleted
-    for idim in range(self.box.ndim):
-      delpos[im,idim] = delpos[tnm,idim]
-
-    delexist[tnm] = 0
-    return delpos, delexist
-
-  def displace(self,dpos,im):
-    """Move molecule to random location in simulation volume
+    last = self.parts.delete(im)
+    if im != last:
+      if cells is not None:
+        cells.relabel(last, im)
+      if verlet is not None:
+        verlet.relabel(last, im)
+
+  def displace(self,im):
+    """Pick a trial position for a molecule
+    A random step of at most maxdisp in each direction, wrapped back into
+    the box, or a random location anywhere in the box if maxdisp is 0
 
     Parameters
     ----------
-    dpos : 2d numpy array 
-        positions of all molecues
     im : int
         which molecule to move
 
     Returns
     -------
-    dpos : 2d numpy array 
-        new positions of all molecues
+    trial : 1d numpy array with length ndim
+        trial position of the molecule
 
     """
-    for idim in range(self.box.ndim):
-      dpos[im,idim] = rand.uniform(self.box.box[0,idim],self.box.box[1,idim])
-    return dpos
+    if self.maxdisp > 0:
+      pos = self.parts.pos
+      for idim in range(self.box.ndim):
+        self.trial[idim] = pos[im,idim] + self.rng.uniform(-self.maxdisp,self.maxdisp)
+      self.box.wrap(self.trial)
+    else:
+      for idim in range(self.box.ndim):
+        self.trial[idim] = self.rng.uniform(self.box.box[0,idim],self.box.box[1,idim])
+    return self.trial
+
+  def getstate(self):
+    """Move statistics and step size, e.g. for a checkpoint"""
+    return {'nattempt': self.nattempt.copy(), 'naccept': self.naccept.copy(),
+            'maxdisp': self.maxdisp, 'tunestart': np.array(self.tunestart),
+            'tunehistory': np.array(self.tunehistory).reshape((-1,3)),
+            'cavfrac': self.cavfrac, 'dlnv': self.dlnv,
+            'volumestart': np.array(self.volumestart),
+            'volumehistory': np.array(self.volumehistory).reshape((-1,3))}
+
+  def setstate(self,state):
+    """Restore from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.nattempt = np.array(state['nattempt'], dtype=float)
+    self.naccept = np.array(state['naccept'], dtype=float)
+    self.maxdisp = float(state['maxdisp'])
+    self.tunestart = tuple(np.asarray(state['tunestart']).tolist())
+    self.tunehistory = [(int(row[0]), row[1], row[2])
+                        for row in np.asarray(state['tunehistory']).tolist()]
+    self.cavfrac = float(state['cavfrac'])
+    self.dlnv = float(state['dlnv'])
+    self.volumestart = tuple(np.asarray(state['volumestart']).tolist())
+    self.volumehistory = [(int(row[0]), row[1], row[2])
+                          for row in np.asarray(state['volumehistory']).tolist()]
+    if self.cavity is not None:
+      self.cavity.build()
 
   def outputefficiency(self, fname='mc'):
     """Output the efficiency of each move
@@ -255,7 +486,7 @@ class moves(object):
 
     """
     movefile = open(fname + '.moves', 'w')
-    movefile.write('# fa_translate fa_insert fa_delete\n')
+    movefile.write('# fa_translate fa_insert fa_delete fa_volume\n')
     for imovetype in range(self.nmovetypes):    
       if self.nattempt[imovetype] > 0:
         ratio = self.naccept[imovetype]/float(self.nattempt[imovetype])
@@ -263,3 +494,28 @@ class moves(object):
         ratio = 0
       movefile.write('%f ' % ratio)
     movefile.write('\n')
+    if self.cavity is not None and self.nattempt[1] > 0:
+      movefile.write('# cavity-biased insertion, rcav %f, mean cavity volume fraction %f\n'
+                     % (self.cavity.rcav, self.cavfrac/self.nattempt[1]))
+    movefile.close()
+
+  def outputtuning(self, fname='mc'):
+    """Output the translation step size and its tuning history
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning
+
+    """
+    tunefile = open(fname + '.tune', 'w')
+    tunefile.write('# maxdisp %f target %f\n' % (self.maxdisp, self.targetaccept))
+    tunefile.write('# step fa_translate maxdisp\n')
+    for imove, ratio, maxdisp in self.tunehistory:
+      tunefile.write('%d %f %f\n' % (imove, ratio, maxdisp))
+    if self.pressure is not None:
+      tunefile.write('# dlnv %f target %f\n' % (self.dlnv, self.volumetarget))
+      tunefile.write('# step fa_volume dlnv\n')
+      for imove, ratio, dlnv in self.volumehistory:
+        tunefile.write('%d %f %f\n' % (imove, ratio, dlnv))
+    tunefile.close()
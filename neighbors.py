@@ -0,0 +1,598 @@
+import itertools
+import numpy as np
+class celllist(object):
+  def __init__(self,box,rc,parts):
+    """Initiate linked-cell list
+    The box is divided into cells at least rc wide, so every neighbor
+    of a molecule within rc is in its own cell or an adjacent one
+
+    Parameters
+    ----------
+    box : class
+       simulation box parameter information, see box.py
+    rc : float
+        interaction cutoff distance
+    parts : class
+        particle store, see particles.py
+
+    self.ncells : 1d int array
+        number of cells in each direction
+    self.members : 2d int array (ncell, capacity)
+        molecule numbers in each cell, only the first self.count[icell] are used
+    parts.cache['cell'] : 1d int array
+        cell of each molecule
+    parts.cache['slot'] : 1d int array
+        position of each molecule in self.members[parts.cache['cell'][imol]]
+    self.neighbors : 2d int array (ncell, nneighbor)
+        cells adjacent to (and including) each cell
+
+    """
+    self.box = box
+    self.parts = parts
+    self.ndim = box.ndim
+    self.rc = rc
+    self.ncells = np.maximum((box.boxlength // rc).astype(int), 1)
+    self.cellsize = box.boxlength / self.ncells
+    self.ncell = int(np.prod(self.ncells))
+    self.capacity = 8
+    self.members = np.zeros((self.ncell, self.capacity), dtype=int)
+    self.count = np.zeros((self.ncell), dtype=int)
+    parts.addcache('cell', dtype=int)
+    parts.addcache('slot', dtype=int)
+    self.setneighbors()
+
+  def setneighbors(self):
+    """Tabulate the adjacent cells of every cell, accounting for PBCs
+    Boxes only one or two cells wide would list a cell twice, so each
+    direction only keeps the distinct cells
+    """
+    rows = []
+    for index in itertools.product(*[range(n) for n in self.ncells]):
+      near = [np.unique((index[idim] + np.array([-1, 0, 1])) % self.ncells[idim])
+              for idim in range(self.ndim)]
+      cells = np.array(list(itertools.product(*near)))
+      rows.append(np.ravel_multi_index(cells.T, self.ncells))
+    self.neighbors = np.array(rows, dtype=int)
+
+  def cellindex(self,pos):
+    """Cell number of one position (or an array of positions)
+
+    Parameters
+    ----------
+    pos : numpy array, last dimension of length ndim
+        position(s)
+
+    """
+    index = np.floor((pos - self.box.box[0]) / self.cellsize).astype(int)
+    index %= self.ncells
+    return np.ravel_multi_index(np.moveaxis(index, -1, 0), self.ncells)
+
+  def build(self):
+    """Place all molecules in their cells from scratch"""
+    self.count[:] = 0
+    cells = self.cellindex(self.parts.pos[:self.parts.nmol,:])
+    for imol in range(self.parts.nmol):
+      self.add(imol, cells[imol])
+
+  def add(self,imol,icell):
+    """Append a molecule to a cell
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+    icell : int
+        cell number
+
+    """
+    if self.count[icell] == self.capacity:
+      self.members = np.concatenate((self.members, np.zeros_like(self.members)), axis=1)
+      self.capacity *= 2
+    self.members[icell, self.count[icell]] = imol
+    self.parts.cache['cell'][imol] = icell
+    self.parts.cache['slot'][imol] = self.count[icell]
+    self.count[icell] += 1
+
+  def insert(self,imol,pos):
+    """Add a molecule at position pos
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+    pos : 1d numpy array with length ndim
+        position of the molecule
+
+    """
+    self.add(imol, self.cellindex(pos))
+
+  def remove(self,imol):
+    """Remove a molecule from its cell
+    The last molecule of the cell fills the hole
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+
+    """
+    cellof = self.parts.cache['cell']
+    slot = self.parts.cache['slot']
+    icell = cellof[imol]
+    last = self.count[icell] - 1
+    jmol = self.members[icell, last]
+    self.members[icell, slot[imol]] = jmol
+    slot[jmol] = slot[imol]
+    self.count[icell] = last
+
+  def move(self,imol,pos):
+    """Update the cell of a displaced molecule
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+    pos : 1d numpy array with length ndim
+        new position of the molecule
+
+    """
+    icell = self.cellindex(pos)
+    if icell != self.parts.cache['cell'][imol]:
+      self.remove(imol)
+      self.add(imol, icell)
+
+  def relabel(self,oldmol,newmol):
+    """A molecule has been renumbered, e.g. moved into the hole left by a deletion
+
+    Parameters
+    ----------
+    oldmol : int
+        old molecule number
+    newmol : int
+        new molecule number
+
+    """
+    cellof = self.parts.cache['cell']
+    slot = self.parts.cache['slot']
+    icell = cellof[oldmol]
+    self.members[icell, slot[oldmol]] = newmol
+    cellof[newmol] = icell
+    slot[newmol] = slot[oldmol]
+
+  def getstate(self):
+    """Copy of the cell members, the cell of each molecule is a particle cache"""
+    return {'members': self.members.copy(), 'count': self.count.copy()}
+
+  def setstate(self,state):
+    """Restore the cell members from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.members = np.array(state['members'], dtype=int)
+    self.count = np.array(state['count'], dtype=int)
+    self.capacity = self.members.shape[1]
+
+  def rescale(self,rc):
+    """Follow a box scaled together with the cutoff
+    The number of cells stays the same, the molecules are placed again
+    so none is left in a neighboring cell by round-off
+
+    Parameters
+    ----------
+    rc : float
+        new interaction cutoff distance
+
+    """
+    self.rc = rc
+    self.cellsize = self.box.boxlength / self.ncells
+    self.build()
+
+  def candidates(self,pos):
+    """Molecules in the cells around a position
+
+    Parameters
+    ----------
+    pos : 1d numpy array with length ndim
+        position
+
+    Returns
+    -------
+    jmol : 1d int array
+        molecule numbers that may be within rc of pos
+
+    """
+    cells = self.neighbors[self.cellindex(pos)]
+    used = np.arange(self.capacity) < self.count[cells][:,np.newaxis]
+    return self.members[cells][used]
+
+class verletlist(object):
+  def __init__(self,box,rc,skin,parts):
+    """Initiate Verlet neighbor list
+    Each molecule lists every molecule within rc + skin of it when the list
+    was built. The list stays valid until some molecule has moved more
+    than skin/2 from where it was at the build.
+
+    Parameters
+    ----------
+    box : class
+       simulation box parameter information, see box.py
+    rc : float
+        interaction cutoff distance
+    skin : float
+        extra distance beyond rc kept in the lists
+    parts : class
+        particle store, see particles.py
+
+    parts.cache['nbr'] : 2d int array (capacity, width)
+        neighbors of each molecule, only the first parts.cache['nnbr'][imol] are used
+    parts.cache['ref'] : 2d numpy array (capacity, ndim)
+        position of each molecule when it entered the list
+    self.nbuild : int
+        number of times the list was built
+
+    """
+    self.box = box
+    self.parts = parts
+    self.ndim = box.ndim
+    self.rc = rc
+    self.skin = skin
+    self.rl2 = (rc + skin)**2.
+    self.halfskin2 = (skin/2.)**2.
+    self.width = 8
+    parts.addcache('nbr', (self.width,), dtype=int)
+    parts.addcache('nnbr', dtype=int)
+    parts.addcache('ref', (box.ndim,))
+    self.nbuild = 0
+    self.pairblock = 2**18
+
+  def build(self):
+    """Build the lists from scratch"""
+    self.nbuild += 1
+    pos = self.parts.pos
+    nmol = self.parts.nmol
+    self.parts.cache['ref'][:nmol,:] = pos[:nmol,:]
+    ilist = []
+    jlist = []
+    nrow = max(1, self.pairblock // max(nmol, 1))
+    for istart in range(0, nmol, nrow):
+      iend = min(istart+nrow, nmol)
+      r = pos[istart:iend,np.newaxis,:] - pos[np.newaxis,:nmol,:]
+      self.box.minimage(r)
+      r2 = np.einsum('ijk,ijk->ij', r, r)
+      r2[np.arange(iend-istart), np.arange(istart, iend)] = self.rl2
+      ii, jj = np.nonzero(r2 < self.rl2)
+      ilist.append(ii + istart)
+      jlist.append(jj)
+    if nmol == 0:
+      return
+    imol = np.concatenate(ilist)
+    jmol = np.concatenate(jlist)
+    count = np.bincount(imol, minlength=nmol)
+    self.grow(int(np.max(count)))
+    self.parts.cache['nnbr'][:nmol] = count
+    # pairs come out sorted by imol
+    first = np.cumsum(count) - count
+    self.parts.cache['nbr'][imol, np.arange(len(imol)) - first[imol]] = jmol
+
+  def grow(self,need):
+    """Widen the neighbor rows so every molecule can hold need neighbors
+
+    Parameters
+    ----------
+    need : int
+        largest number of neighbors of any molecule
+
+    """
+    if need <= self.width:
+      return
+    while self.width < need:
+      self.width *= 2
+    old = self.parts.cache['nbr']
+    nbr = self.parts.addcache('nbr', (self.width,), dtype=int)
+    nbr[:,:old.shape[1]] = old
+
+  def valid(self,imol,pos):
+    """Check whether the list of imol covers it at position pos
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+    pos : 1d numpy array with length ndim
+        (trial) position of imol
+
+    """
+    d = pos - self.parts.cache['ref'][imol,:]
+    self.box.minimage(d)
+    return np.dot(d, d) <= self.halfskin2
+
+  def candidates(self,imol):
+    """Listed neighbors of a molecule
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+
+    """
+    return self.parts.cache['nbr'][imol,:self.parts.cache['nnbr'][imol]]
+
+  def pairs(self):
+    """All listed pairs, each once
+
+    Returns
+    -------
+    imol, jmol : 1d int arrays
+        molecule numbers of each pair, imol < jmol
+
+    """
+    nmol = self.parts.nmol
+    used = np.arange(self.width) < self.parts.cache['nnbr'][:nmol,np.newaxis]
+    imol = np.nonzero(used)[0]
+    jmol = self.parts.cache['nbr'][:nmol][used]
+    keep = jmol > imol
+    return imol[keep], jmol[keep]
+
+  def move(self,imol):
+    """Update after an accepted displacement, rebuilding if it left the skin
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+
+    """
+    if not self.valid(imol, self.parts.pos[imol,:]):
+      self.build()
+
+  def insert(self,imol):
+    """Add a molecule to the lists, it must already be in the particle store
+
+    Parameters
+    ----------
+    imol : int
+        number of the new molecule
+
+    """
+    ref = self.parts.cache['ref']
+    nnbr = self.parts.cache['nnbr']
+    ref[imol,:] = self.parts.pos[imol,:]
+    # compare against the build positions of the others
+    r = ref[:imol,:] - ref[imol,:]
+    self.box.minimage(r)
+    jmol = np.nonzero(np.einsum('ij,ij->i', r, r) < self.rl2)[0]
+    self.grow(max(len(jmol), int(np.max(nnbr[jmol], initial=0)) + 1))
+    nbr = self.parts.cache['nbr']
+    nbr[imol,:len(jmol)] = jmol
+    nnbr[imol] = len(jmol)
+    nbr[jmol, nnbr[jmol]] = imol
+    nnbr[jmol] += 1
+
+  def remove(self,imol):
+    """Take a molecule out of its neighbors' lists
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+
+    """
+    nbr = self.parts.cache['nbr']
+    nnbr = self.parts.cache['nnbr']
+    for jmol in self.candidates(imol):
+      last = nnbr[jmol] - 1
+      row = nbr[jmol]
+      row[np.nonzero(row[:last+1] == imol)[0][0]] = row[last]
+      nnbr[jmol] = last
+    nnbr[imol] = 0
+
+  def relabel(self,oldmol,newmol):
+    """A molecule has been renumbered, e.g. moved into the hole left by a deletion
+    The particle store must already have moved its row (and list) to newmol
+
+    Parameters
+    ----------
+    oldmol : int
+        old molecule number
+    newmol : int
+        new molecule number
+
+    """
+    nbr = self.parts.cache['nbr']
+    nnbr = self.parts.cache['nnbr']
+    for jmol in self.candidates(newmol):
+      row = nbr[jmol,:nnbr[jmol]]
+      row[row == oldmol] = newmol
+
+  def getstate(self):
+    """Counters of the lists, the lists themselves are particle caches"""
+    return {'width': self.width, 'nbuild': self.nbuild, 'rc': self.rc, 'skin': self.skin}
+
+  def setstate(self,state):
+    """Restore the counters from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.width = int(state['width'])
+    self.nbuild = int(state['nbuild'])
+    self.rc = float(state['rc'])
+    self.skin = float(state['skin'])
+    self.rl2 = (self.rc + self.skin)**2.
+    self.halfskin2 = (self.skin/2.)**2.
+
+  def rescale(self,s):
+    """Follow the box, the cutoff and all positions scaled by s
+    Pair distances, the cutoff and the skin all scale together, so the
+    lists stay valid with the build positions scaled as well
+
+    Parameters
+    ----------
+    s : float
+        scale factor
+
+    """
+    self.rc *= s
+    self.skin *= s
+    self.rl2 = (self.rc + self.skin)**2.
+    self.halfskin2 = (self.skin/2.)**2.
+    self.parts.cache['ref'][:self.parts.nmol,:] *= s
+
+  def output(self,nmoves,fname='mc'):
+    """Output how often the lists were rebuilt, for tuning the skin
+
+    Parameters
+    ----------
+    nmoves : int
+        number of MC moves in the run
+    fname : string
+        out filename beginning
+
+    """
+    verletfile = open(fname + '.verlet', 'w')
+    verletfile.write('# skin nbuild moves_per_build\n')
+    verletfile.write('%f %d %f\n' % (self.skin, self.nbuild, nmoves/float(max(self.nbuild, 1))))
+    verletfile.close()
+
+class cavitygrid(object):
+  def __init__(self,box,rcav,parts):
+    """Initiate grid of cavities for cavity-biased insertion
+    The box is divided into grid cells about rcav/2 wide; a grid cell is
+    a cavity when no molecule is within rcav of its center. The number of
+    molecules within rcav of every center is kept up to date, so the
+    cavities follow every accepted move
+
+    Parameters
+    ----------
+    box : class
+       simulation box parameter information, see box.py
+    rcav : float
+        cavity radius
+    parts : class
+        particle store, see particles.py
+
+    self.occupancy : 1d int array
+        number of molecules within rcav of each grid cell center
+    self.ncav : int
+        number of cavity grid cells
+    self.offsets : 2d int array (noffset, ndim)
+        grid cells around a molecule that may be within rcav of it
+
+    """
+    self.box = box
+    self.parts = parts
+    self.ndim = box.ndim
+    self.rcav = rcav
+    self.rcav2 = rcav*rcav
+    self.ngrid = np.maximum((2.*box.boxlength/rcav).astype(int), 1)
+    self.spacing = box.boxlength/self.ngrid
+    self.cellvol = float(np.prod(self.spacing))
+    self.occupancy = np.zeros((int(np.prod(self.ngrid))), dtype=int)
+    self.ncav = len(self.occupancy)
+    reach = np.ceil(rcav/self.spacing).astype(int)
+    self.offsets = np.array(list(itertools.product(*[range(-reach[idim], reach[idim]+1)
+                                                     for idim in range(self.ndim)])), dtype=int)
+    # a wide stencil in a narrow box reaches the same cell twice
+    self.aliased = np.any(2*reach + 1 > self.ngrid)
+
+  def gridindex(self,pos):
+    """Grid cell of a position in each direction"""
+    index = ((pos - self.box.box[0,:])/self.spacing).astype(int)
+    return np.minimum(index, self.ngrid - 1)
+
+  def stencil(self,pos):
+    """Grid cells whose centers are within rcav of a position
+
+    Parameters
+    ----------
+    pos : 1d numpy array with length ndim
+        position
+
+    Returns
+    -------
+    cells : 1d int array
+        flat grid cell numbers
+
+    """
+    index = self.gridindex(pos) + self.offsets
+    r = self.box.box[0,:] + (index + 0.5)*self.spacing - pos
+    self.box.minimage(r)
+    near = np.einsum('ij,ij->i', r, r) < self.rcav2
+    cells = np.ravel_multi_index((index[near] % self.ngrid).T, self.ngrid)
+    if self.aliased:
+      cells = np.unique(cells)
+    return cells
+
+  def build(self):
+    """Count the molecules around every grid cell from scratch"""
+    self.occupancy[:] = 0
+    for imol in range(self.parts.nmol):
+      self.occupancy[self.stencil(self.parts.pos[imol,:])] += 1
+    self.ncav = int(np.sum(self.occupancy == 0))
+
+  def add(self,pos):
+    """Count a molecule at pos"""
+    cells = self.stencil(pos)
+    self.ncav -= int(np.sum(self.occupancy[cells] == 0))
+    self.occupancy[cells] += 1
+
+  def remove(self,pos):
+    """Stop counting a molecule at pos"""
+    cells = self.stencil(pos)
+    self.occupancy[cells] -= 1
+    self.ncav += int(np.sum(self.occupancy[cells] == 0))
+
+  def trial(self,stream):
+    """Random position in a random cavity grid cell
+
+    Parameters
+    ----------
+    stream : class
+        random number stream, see rng.py
+
+    Returns
+    -------
+    pos : 1d numpy array with length ndim
+        trial position, None if there is no cavity
+    vcav : float
+        volume of all cavity grid cells
+
+    """
+    if self.ncav == 0:
+      return None, 0.
+    icav = np.flatnonzero(self.occupancy == 0)[stream.randint(self.ncav)]
+    index = np.array(np.unravel_index(icav, self.ngrid))
+    pos = np.zeros((self.ndim))
+    for idim in range(self.ndim):
+      pos[idim] = self.box.box[0,idim] + (index[idim] + stream.random())*self.spacing[idim]
+    return pos, self.ncav*self.cellvol
+
+  def removal(self,pos):
+    """Cavity volume after removing a molecule at pos
+    Removing it is only the reverse of a biased insertion if its own grid
+    cell is a cavity once it is gone
+
+    Parameters
+    ----------
+    pos : 1d numpy array with length ndim
+        position of the molecule
+
+    Returns
+    -------
+    vcav : float
+        cavity volume without the molecule, 0 if its grid cell would not be a cavity
+
+    """
+    cells = self.stencil(pos)
+    own = np.ravel_multi_index(self.gridindex(pos), self.ngrid)
+    counted = np.any(cells == own)
+    if self.occupancy[own] - (1 if counted else 0) > 0:
+      return 0.
+    return (self.ncav + int(np.sum(self.occupancy[cells] == 1)))*self.cellvol
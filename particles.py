@@ -0,0 +1,212 @@
+import numpy as np
+class particles(object):
+  def __init__(self,ndim,capacity=16):
+    """Initiate particle store
+    Keeps the molecule positions and any per-molecule caches together.
+    Molecules 0 to nmol-1 are in the box, the rows after that are free.
+
+    Parameters
+    ----------
+    ndim : int
+        number of simulation dimensions
+    capacity : int
+        number of rows to reserve, the store grows when it is full
+
+    self.pos : 2d numpy array (capacity, ndim)
+        positions, only the first self.nmol rows are used
+    self.nmol : int
+        number of molecules
+    self.cache : dictionary of numpy arrays
+        per-molecule data (e.g. cell index, energy) with one row per
+        molecule, kept in step with self.pos on insertion and deletion
+    self.nspecies : int
+        number of species, see setspecies
+
+    """
+    self.ndim = ndim
+    self.capacity = max(int(capacity), 1)
+    self.pos = np.zeros((self.capacity, ndim))
+    self.nmol = 0
+    self.cache = {}
+    self.nspecies = 1
+
+  def setspecies(self,nspecies,species=None):
+    """Give every molecule a species, for mixtures
+
+    Parameters
+    ----------
+    nspecies : int
+        number of species
+    species : 1d int array with length nmol
+        species of the molecules in the store, all 0 if not given
+
+    self.cache['species'] : 1d int array
+        species of each molecule
+    self.nmolspecies : 1d int array with length nspecies
+        number of molecules of each species
+
+    """
+    self.nspecies = nspecies
+    self.addcache('species', dtype=int)
+    if species is not None:
+      self.cache['species'][:self.nmol] = species
+    self.countspecies()
+
+  def countspecies(self):
+    """Count the molecules of each species from scratch"""
+    self.nmolspecies = np.bincount(self.cache['species'][:self.nmol], minlength=self.nspecies)
+
+  def addcache(self,name,shape=(),dtype=float):
+    """Add a per-molecule cache
+
+    Parameters
+    ----------
+    name : string
+        key in self.cache
+    shape : tuple
+        shape of the data of one molecule
+    dtype : numpy dtype
+        data type
+
+    Returns
+    -------
+    cache : numpy array (capacity,) + shape
+
+    """
+    self.cache[name] = np.zeros((self.capacity,) + tuple(shape), dtype=dtype)
+    return self.cache[name]
+
+  def reserve(self,n):
+    """Make room for at least n molecules, doubling the capacity as needed
+
+    Parameters
+    ----------
+    n : int
+        number of molecules
+
+    """
+    if n <= self.capacity:
+      return
+    capacity = self.capacity
+    while capacity < n:
+      capacity *= 2
+    self.pos = self.grown(self.pos, capacity)
+    for name in self.cache:
+      self.cache[name] = self.grown(self.cache[name], capacity)
+    self.capacity = capacity
+
+  def grown(self,array,capacity):
+    """Copy of array with capacity rows"""
+    new = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    new[:self.nmol] = array[:self.nmol]
+    return new
+
+  def insert(self,pos,species=0):
+    """Add one molecule, or a batch of them, after the last one
+
+    Parameters
+    ----------
+    pos : numpy array (ndim) or (n, ndim)
+        position(s) of the new molecule(s)
+    species : int or 1d int array
+        species of the new molecule(s), for mixtures
+
+    Returns
+    -------
+    imol : int
+        number of the (first) new molecule
+
+    """
+    pos = np.asarray(pos)
+    n = 1 if pos.ndim == 1 else len(pos)
+    imol = self.nmol
+    self.reserve(imol + n)
+    self.pos[imol:imol+n] = pos
+    self.nmol += n
+    if self.nspecies > 1:
+      self.cache['species'][imol:imol+n] = species
+      self.nmolspecies += np.bincount(np.broadcast_to(species, (n,)), minlength=self.nspecies)
+    return imol
+
+  def delete(self,imol):
+    """Delete a molecule, the last molecule moves into its place
+
+    Parameters
+    ----------
+    imol : int
+        molecule number
+
+    Returns
+    -------
+    last : int
+        old number of the molecule that now has number imol
+        (equal to imol if the last molecule was deleted)
+
+    """
+    last = self.nmol - 1
+    if self.nspecies > 1:
+      self.nmolspecies[self.cache['species'][imol]] -= 1
+    if imol != last:
+      self.pos[imol] = self.pos[last]
+      for name in self.cache:
+        self.cache[name][imol] = self.cache[name][last]
+    self.nmol = last
+    return last
+
+  def swap(self,imol,jmol):
+    """Exchange the numbers of two molecules
+
+    Parameters
+    ----------
+    imol, jmol : int
+        molecule numbers
+
+    """
+    self.pos[[imol,jmol]] = self.pos[[jmol,imol]]
+    for name in self.cache:
+      self.cache[name][[imol,jmol]] = self.cache[name][[jmol,imol]]
+
+  def getstate(self):
+    """Copy of the molecules and their caches, e.g. for a checkpoint"""
+    state = {'pos': self.pos[:self.nmol].copy()}
+    for name in self.cache:
+      state['cache_' + name] = self.cache[name][:self.nmol].copy()
+    return state
+
+  def setstate(self,state):
+    """Restore the molecules and caches from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.setpositions(state['pos'])
+    for key in state:
+      if key.startswith('cache_'):
+        rows = np.asarray(state[key])
+        cache = self.addcache(key[len('cache_'):], rows.shape[1:], rows.dtype)
+        cache[:self.nmol] = rows
+    if self.nspecies > 1:
+      self.countspecies()
+
+  def setpositions(self,pos,species=None):
+    """Replace all molecules
+
+    Parameters
+    ----------
+    pos : 2d numpy array (nmol, ndim)
+        positions
+    species : 1d int array with length nmol
+        species of the molecules, for mixtures
+
+    """
+    self.nmol = 0
+    self.reserve(len(pos))
+    self.pos[:len(pos)] = pos
+    self.nmol = len(pos)
+    if self.nspecies > 1:
+      if species is not None:
+        self.cache['species'][:self.nmol] = species
+      self.countspecies()
@@ -0,0 +1,398 @@
+import math as ma
+import numpy as np
+forms = ['truncated', 'shifted', 'forceshifted']
+mixingrules = ['lb', 'geometric']
+
+def mix(sigmas,epsilons,rc,rule='lb',overrides=None):
+  """Pair parameters of a mixture from those of each species
+
+  Parameters
+  ----------
+  sigmas, epsilons : lists of floats
+      LJ distance and interaction strength of each species
+  rc : float
+      cutoff of every pair that is not overridden
+  rule : string
+      lb : Lorentz-Berthelot, arithmetic mean of sigma, geometric of epsilon
+      geometric : geometric mean of both
+  overrides : dictionary
+      (i, j) : (sigma, epsilon) or (sigma, epsilon, rc) of a pair of
+      species, replacing the mixing rule
+
+  Returns
+  -------
+  sigma, epsilon, rcs : 2d numpy arrays (nspecies, nspecies)
+      parameters of every pair of species
+
+  """
+  if rule not in mixingrules:
+    raise ValueError('unknown mixing rule %s, use one of %s' % (rule, ', '.join(mixingrules)))
+  sigmas = np.asarray(sigmas, dtype=float)
+  epsilons = np.asarray(epsilons, dtype=float)
+  if rule == 'lb':
+    sigma = 0.5*(sigmas[:,np.newaxis] + sigmas[np.newaxis,:])
+  else:
+    sigma = np.sqrt(sigmas[:,np.newaxis]*sigmas[np.newaxis,:])
+  epsilon = np.sqrt(epsilons[:,np.newaxis]*epsilons[np.newaxis,:])
+  rcs = np.zeros((len(sigmas), len(sigmas))) + rc
+  if overrides is not None:
+    for (i, j), values in overrides.items():
+      sigma[i,j] = sigma[j,i] = values[0]
+      epsilon[i,j] = epsilon[j,i] = values[1]
+      if len(values) > 2:
+        if values[2] > rc:
+          raise ValueError('cutoff %f of species %d and %d is beyond the cutoff %f' % (values[2], i, j, rc))
+        rcs[i,j] = rcs[j,i] = values[2]
+  return sigma, epsilon, rcs
+
+class potential(object):
+  def __init__(self,sigma=1.,epsilon=1.,rc=2.5,form='truncated',ndim=3,tail=None):
+    """Initiate Lennard-Jones pair potential
+    All functions take squared separations. For a mixture the parameters
+    are matrices over pairs of species, flattened so the pair type of
+    species i and j is i*nspecies + j, and the functions also take the
+    type of each pair
+
+    Parameters
+    ----------
+    sigma : float or 2d numpy array (nspecies, nspecies)
+        LJ distance
+    epsilon : float or 2d numpy array (nspecies, nspecies)
+        LJ interaction strength
+    rc : float or 2d numpy array (nspecies, nspecies)
+        cutoff distance
+    form : string
+        truncated : plain LJ inside the cutoff
+        shifted : truncated and shifted so the energy is 0 at rc
+        forceshifted : energy and force are both 0 at rc
+    ndim : int
+        number of dimensions, for the tail corrections
+    tail : bool
+        add the long-range tail corrections to the energy and pressure,
+        by default only for the truncated form (for the others the
+        shifted potential is taken as the model)
+
+    self.table : bool
+        whether energy() and force() interpolate the tables, see tabulate
+
+    """
+    if form not in forms:
+      raise ValueError('unknown potential form %s, use one of %s' % (form, ', '.join(forms)))
+    self.nspecies = 1 if np.ndim(sigma) == 0 else len(sigma)
+    if self.nspecies > 1:
+      sigma = np.ravel(sigma)
+      epsilon = np.ravel(epsilon)
+      rc = np.ravel(np.zeros((self.nspecies, self.nspecies)) + rc)
+    self.sigma = sigma
+    self.epsilon = epsilon
+    self.rc = rc
+    self.rc2 = rc*rc
+    # only a mixture with different cutoffs needs a check of each pair
+    self.paircutoff = np.ndim(rc) > 0 and np.min(rc) < np.max(rc)
+    self.form = form
+    self.ndim = ndim
+    self.a = 4.*epsilon*sigma**12.
+    self.b = 4.*epsilon*sigma**6.
+    self.fprea = 48. * epsilon * sigma**12.
+    self.fpreb = 24. * epsilon * sigma**6.
+    # energy and force (not over r) of plain LJ at the cutoff, and their r^-12 parts
+    self.urc = self.ljenergy(np.asarray(self.rc2, dtype=float))
+    self.frc = self.ljforce(np.asarray(self.rc2, dtype=float))*rc
+    if self.nspecies == 1:
+      self.urc = float(self.urc)
+      self.frc = float(self.frc)
+    self.urc12 = self.a*rc**-12.
+    self.frc12 = 12.*self.a*rc**-13.
+    if tail is None:
+      tail = (form == 'truncated')
+    self.settail(tail)
+    self.table = False
+    # bins of the last batch looked up in the tables, see bins
+    self.binr2 = None
+    self.binned = None
+
+  def pick(self,values,ptype):
+    """Parameter of each pair, the parameter itself for one species"""
+    if ptype is None:
+      return values
+    return values.take(ptype)
+
+  def ljenergy(self,r2,ptype=None):
+    """Plain LJ energy of a batch of pairs"""
+    ir6 = 1./(r2*r2*r2)
+    return (self.pick(self.a, ptype)*ir6 - self.pick(self.b, ptype))*ir6
+
+  def ljforce(self,r2,ptype=None):
+    """Plain LJ force over distance of a batch of pairs"""
+    ir2 = 1./r2
+    ir6 = ir2*ir2*ir2
+    return (self.pick(self.fprea, ptype)*ir6 - self.pick(self.fpreb, ptype))*ir6*ir2
+
+  def cutoff(self,values,r2,ptype):
+    """Zero the pairs beyond their own cutoff, for mixtures with different cutoffs"""
+    if self.paircutoff and ptype is not None:
+      values[r2 >= self.rc2.take(ptype)] = 0.
+    return values
+
+  def exactenergy(self,r2,ptype=None):
+    """Energy of a batch of pairs from the analytic form
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations, all inside the cutoff
+    ptype : 1d int array
+        type of each pair, for mixtures
+
+    Returns
+    -------
+    u : 1d numpy array
+        energy of each pair
+
+    """
+    u = self.ljenergy(r2, ptype)
+    if self.form == 'shifted':
+      u -= self.pick(self.urc, ptype)
+    elif self.form == 'forceshifted':
+      u -= self.pick(self.urc, ptype) - (np.sqrt(r2) - self.pick(self.rc, ptype))*self.pick(self.frc, ptype)
+    return self.cutoff(u, r2, ptype)
+
+  def energy12(self,r2,ptype=None):
+    """The r^-12 part of the energy of a batch of pairs
+    With the cutoff a fixed fraction of the box, the r^-12 part of every
+    form scales as s^-12 and the rest as s^-6 when the box is scaled by s,
+    see energy.rescale
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations, all inside the cutoff
+    ptype : 1d int array
+        type of each pair, for mixtures
+
+    """
+    ir6 = 1./(r2*r2*r2)
+    u = self.pick(self.a, ptype)*ir6*ir6
+    if self.form == 'shifted':
+      u -= self.pick(self.urc12, ptype)
+    elif self.form == 'forceshifted':
+      u -= self.pick(self.urc12, ptype) - (np.sqrt(r2) - self.pick(self.rc, ptype))*self.pick(self.frc12, ptype)
+    return self.cutoff(u, r2, ptype)
+
+  def exactforce(self,r2,ptype=None):
+    """Force over distance of a batch of pairs from the analytic form
+    The force on molecule i from j is force(r2)*(pos[i] - pos[j])
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations, all inside the cutoff
+    ptype : 1d int array
+        type of each pair, for mixtures
+
+    Returns
+    -------
+    ff : 1d numpy array
+        force divided by separation of each pair
+
+    """
+    ff = self.ljforce(r2, ptype)
+    if self.form == 'forceshifted':
+      ff -= self.pick(self.frc, ptype)/np.sqrt(r2)
+    return self.cutoff(ff, r2, ptype)
+
+  def energy(self,r2,ptype=None):
+    """Energy of a batch of pairs, from the tables if they are set up"""
+    if self.table:
+      return self.lookup(r2, self.utable, self.uslope, self.exactenergy)
+    return self.exactenergy(r2, ptype)
+
+  def force(self,r2,ptype=None):
+    """Force over distance of a batch of pairs, from the tables if they are set up"""
+    if self.table:
+      return self.lookup(r2, self.ftable, self.fslope, self.exactforce)
+    return self.exactforce(r2, ptype)
+
+  def tabulate(self,tol=1e-6,r2min=None,maxpoints=2**22,npoints=256):
+    """Set up linear interpolation tables in r^2 for energy and force
+    The number of points is doubled until the error at points between
+    the nodes is below tol, relative to the value plus epsilon (or
+    epsilon/sigma^2 for the force) so it stays meaningful near zero;
+    separations below r2min are always evaluated analytically
+
+    Parameters
+    ----------
+    tol : float
+        largest relative interpolation error
+    r2min : float
+        start of the tables, defaults to (0.7 sigma)^2 where the energy
+        is already about 100 epsilon
+    maxpoints : int
+        largest table size
+    npoints : int
+        smallest table size
+
+    Returns
+    -------
+    error : float
+        largest relative error of the tables
+
+    """
+    if self.nspecies > 1:
+      raise ValueError('interpolation tables are only set up for one species')
+    if r2min is None:
+      r2min = (0.7*self.sigma)**2.
+    self.r2min = r2min
+    while True:
+      grid = np.linspace(r2min, self.rc2, npoints+1)
+      u = self.exactenergy(grid)
+      ff = self.exactforce(grid)
+      self.utable = u[:-1].copy()
+      self.uslope = np.diff(u)
+      self.ftable = ff[:-1].copy()
+      self.fslope = np.diff(ff)
+      self.inv = npoints/(self.rc2 - r2min)
+      self.offset = r2min*self.inv
+      self.npoints = npoints
+      self.binr2 = None
+      # check between the nodes, where linear interpolation is worst
+      test = (grid[:-1,np.newaxis] + np.diff(grid)[:,np.newaxis]*
+              np.array([0.25, 0.5, 0.75])[np.newaxis,:]).ravel()
+      test = test[test < self.rc2]
+      uexact = self.exactenergy(test)
+      fexact = self.exactforce(test)
+      error = max(np.max(np.abs(self.lookup(test, self.utable, self.uslope) - uexact)
+                         /(np.abs(uexact) + self.epsilon)),
+                  np.max(np.abs(self.lookup(test, self.ftable, self.fslope) - fexact)
+                         /(np.abs(fexact) + self.epsilon/self.sigma**2.)))
+      if error < tol or npoints >= maxpoints:
+        break
+      npoints *= 2
+    self.table = True
+    return error
+
+  def bins(self,r2):
+    """Table bin of each pair and its place inside the bin
+    The bins of the last batch are kept, so the energy and the force of
+    the same pairs (calcforces, or the accumulators of a sample) find them
+    once; r2 must not be changed in place in between
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations, all inside the cutoff
+
+    Returns
+    -------
+    i : 1d int array
+        bin of each pair
+    frac : 1d numpy array
+        place inside the bin, from 0 to 1
+    low : 1d bool array
+        pairs below the start of the table, None if there are none
+
+    """
+    if r2 is self.binr2:
+      return self.binned
+    x = r2*self.inv
+    x -= self.offset
+    low = None
+    if len(x) > 0 and x.min() < 0:
+      low = x < 0
+      x[low] = 0
+    # r2 within an ulp of rc2 can round up to the end of the last bin
+    i = np.minimum(x.astype(np.intp), self.npoints-1)
+    x -= i
+    self.binr2 = r2
+    self.binned = (i, x, low)
+    return self.binned
+
+  def lookup(self,r2,table,slope,exact=None):
+    """Interpolate a table
+
+    Parameters
+    ----------
+    r2 : 1d numpy array
+        squared pair separations, all inside the cutoff
+    table, slope : 1d numpy arrays
+        value at each node and difference to the next node
+    exact : function
+        analytic form, used below the start of the table
+
+    """
+    i, frac, low = self.bins(r2)
+    u = slope.take(i)
+    u *= frac
+    u += table.take(i)
+    if low is not None and exact is not None:
+      u[low] = exact(r2[low])
+    return u
+
+  def settail(self,tail):
+    """Set up the long-range tail corrections in ndim dimensions
+    For a uniform fluid beyond the cutoff
+      U_tail = N rho/2 S_d int_rc^inf u(r) r^(d-1) dr
+      P_tail = -rho^2/(2d) S_d int_rc^inf r u'(r) r^(d-1) dr
+    with S_d the surface of the unit d-sphere; for a mixture the
+    coefficients are matrices summed over N_i N_j (or rho_i rho_j)
+
+    Parameters
+    ----------
+    tail : bool
+        switch the corrections on
+
+    """
+    self.tail = tail
+    if not tail:
+      self.utailcoef = 0.
+      self.utailcoef12 = 0.
+      self.ptailcoef = 0.
+      return
+    d = float(self.ndim)
+    surface = d*ma.pi**(d/2.)/ma.gamma(d/2. + 1.)
+    shape = (self.nspecies, self.nspecies) if self.nspecies > 1 else ()
+    rc = np.reshape(self.rc, shape)
+    a = np.reshape(self.a, shape)
+    b = np.reshape(self.b, shape)
+    # integrals of the r^-12 and r^-6 terms times r^(d-1)
+    i12 = rc**(d - 12.)/(12. - d)
+    i6 = rc**(d - 6.)/(6. - d)
+    self.utailcoef = 0.5*surface*(a*i12 - b*i6)
+    self.utailcoef12 = 0.5*surface*a*i12
+    self.ptailcoef = -0.5*surface/d*(-12.*a*i12 + 6.*b*i6)
+    if self.nspecies == 1:
+      self.utailcoef = float(self.utailcoef)
+      self.utailcoef12 = float(self.utailcoef12)
+      self.ptailcoef = float(self.ptailcoef)
+
+  def tailsum(self,coef,n):
+    """coef n n, or n_i coef_ij n_j for a mixture"""
+    if self.nspecies == 1:
+      return coef*n*n
+    return float(np.dot(n, np.dot(coef, n)))
+
+  def tailsingle(self,coef,n,species):
+    """Change of tailsum from adding one molecule of species to n - 1 of it"""
+    if self.nspecies == 1:
+      return coef*(2*n - 1)
+    return float(2.*np.dot(coef[species], n) - coef[species,species])
+
+  def utail(self,nmol,vol):
+    """Tail energy of nmol molecules (of each species) in volume vol"""
+    return self.tailsum(self.utailcoef, nmol)/vol
+
+  def utailsingle(self,nmol,vol,species=0):
+    """Tail energy of one molecule of nmol (itself included), U_tail(nmol) - U_tail(nmol-1)"""
+    return self.tailsingle(self.utailcoef, nmol, species)/vol
+
+  def utail12(self,nmol,vol):
+    """The r^-12 part of utail"""
+    return self.tailsum(self.utailcoef12, nmol)/vol
+
+  def utailsingle12(self,nmol,vol,species=0):
+    """The r^-12 part of utailsingle"""
+    return self.tailsingle(self.utailcoef12, nmol, species)/vol
+
+  def ptail(self,rho):
+    """Tail pressure at number density rho (of each species)"""
+    return self.tailsum(self.ptailcoef, rho)
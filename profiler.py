@@ -0,0 +1,149 @@
+import sys, time
+class profiler(object):
+  def __init__(self,timing=True,nprogress=0):
+    """Initiate run profiler
+    Methods are timed by replacing them on their instance with a timed
+    wrapper, so nothing is added to the move loop of a run without one
+
+    Parameters
+    ----------
+    timing : bool
+        time the phases of the run
+    nprogress : int
+        moves between progress lines, 0 for none
+
+    self.phases : dictionary of lists
+        [calls, seconds, pair separations] of each phase, phases are
+        timed inclusively (the move phase contains calcenergy)
+
+    """
+    self.timing = timing
+    self.nprogress = nprogress
+    self.phases = {}
+    self.order = []
+
+  def attach(self,sim):
+    """Instrument the phases of a simulation
+
+    Parameters
+    ----------
+    sim : class
+        simulation, see simulation.py
+
+    """
+    en = sim.en
+    parts = sim.parts
+    if self.timing:
+      self.instrument(en, 'calcenergy', pairs=en)
+      self.instrument(en, 'calcfullenergy', pairs=en)
+      self.instrument(en, 'calcforces', pairs=en)
+      self.instrument(en, 'checkdrift')
+      self.instrument(sim.mv, 'place')
+      self.instrument(sim.mv, 'delete')
+      self.instrument(sim.mv, 'tune')
+      self.instrument(sim.mv, 'move')
+      if sim.inp.NPT:
+        self.instrument(sim.mv, 'volumemove')
+      self.instrument(sim.smp, 'sample', pairs=en)
+      if sim.inp.writeconfigs:
+        self.instrument(sim.config, 'writeframe')
+      self.instrument(sim.io, 'update', 'tally')
+      self.instrument(sim.chk, 'write', 'checkpoint')
+      self.instrument(sim, 'run')
+    if self.nprogress > 0:
+      self.progress(sim)
+
+  def instrument(self,obj,method,name=None,pairs=None):
+    """Replace a method of an instance by a timed wrapper
+
+    Parameters
+    ----------
+    obj : instance
+        object whose method is timed
+    method : string
+        method name
+    name : string
+        phase name, defaults to the method name
+    pairs : class
+        energy whose pair separation count (energy.npaircount) the
+        method advances, see energy.py
+
+    """
+    if name is None:
+      name = method
+    func = getattr(obj, method)
+    if name not in self.phases:
+      self.phases[name] = [0, 0., 0]
+      self.order.append(name)
+    stats = self.phases[name]
+    clock = time.perf_counter
+    if pairs is None:
+      def timed(*args, **kwargs):
+        start = clock()
+        result = func(*args, **kwargs)
+        stats[1] += clock() - start
+        stats[0] += 1
+        return result
+    else:
+      def timed(*args, **kwargs):
+        npair = pairs.npaircount
+        start = clock()
+        result = func(*args, **kwargs)
+        stats[1] += clock() - start
+        stats[0] += 1
+        stats[2] += pairs.npaircount - npair
+        return result
+    setattr(obj, method, timed)
+
+  def progress(self,sim):
+    """Print a progress line every nprogress moves
+
+    Parameters
+    ----------
+    sim : class
+        simulation, see simulation.py
+
+    """
+    func = sim.mv.move
+    nprogress = self.nprogress
+    state = {'moves': 0, 'last': time.perf_counter()}
+    def move():
+      func()
+      state['moves'] += 1
+      if state['moves'] % nprogress == 0:
+        now = time.perf_counter()
+        sys.stdout.write('%s: %d moves, %.0f moves/s, N %d, U %f\n' % (sim.inp.fname,
+                         state['moves'], nprogress/(now - state['last']), sim.mv.nmol, sim.en.tu))
+        sys.stdout.flush()
+        state['last'] = now
+    sim.mv.move = move
+
+  def output(self,mv,fname='mc'):
+    """Write the time, calls and pair separations of every phase and the move acceptance
+
+    Parameters
+    ----------
+    mv : class
+        moves, see moves.py
+    fname : string
+        out filename beginning
+
+    """
+    perffile = open(fname + '.perf', 'w')
+    total = self.phases['run'][1] if 'run' in self.phases else 0.
+    perffile.write('# phase calls seconds us_per_call fraction_of_run pairs pairs_per_s\n')
+    for name in self.order:
+      calls, seconds, npair = self.phases[name]
+      percall = 1e6*seconds/calls if calls > 0 else 0.
+      fraction = seconds/total if total > 0 else 0.
+      pairrate = npair/seconds if seconds > 0 else 0.
+      perffile.write('%s %d %f %f %f %d %e\n' % (name, calls, seconds, percall, fraction,
+                                                npair, pairrate))
+    perffile.write('# movetype attempts accepted fa\n')
+    for imovetype, movetype in enumerate(['translate', 'insert', 'delete', 'volume']):
+      nattempt = mv.nattempt[imovetype]
+      ratio = mv.naccept[imovetype]/float(nattempt) if nattempt > 0 else 0
+      perffile.write('%s %d %d %f\n' % (movetype, nattempt, mv.naccept[imovetype], ratio))
+    if total > 0 and 'move' in self.phases:
+      perffile.write('# moves_per_s %f\n' % (self.phases['move'][0]/total))
+    perffile.close()
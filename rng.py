@@ -0,0 +1,113 @@
+import json
+import numpy as np
+class rng(object):
+  def __init__(self,seed=None,blocksize=4096):
+    """Initiate random number stream for one run
+    Uniform numbers are drawn from a numpy Generator in blocks, so the
+    move loop does not pay for a generator call on every draw
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence
+        seed of the stream, None for a fresh one from the operating system
+    blocksize : int
+        number of random numbers generated at a time
+
+    self.generator : numpy.random.Generator
+        underlying generator
+    self.block : list of floats
+        pre-generated uniform numbers in [0,1)
+    self.index : int
+        next unused number in self.block
+
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+      seed = np.random.SeedSequence(seed)
+    self.seedseq = seed
+    self.generator = np.random.Generator(np.random.PCG64(seed))
+    self.blocksize = blocksize
+    self.block = []
+    self.index = 0
+
+  def refill(self):
+    """Generate the next block of numbers"""
+    self.block = self.generator.random(self.blocksize).tolist()
+    self.index = 0
+
+  def random(self):
+    """Uniform number in [0,1)"""
+    if self.index == len(self.block):
+      self.refill()
+    self.index += 1
+    return self.block[self.index-1]
+
+  def uniform(self,low,high):
+    """Uniform number in [low,high)
+
+    Parameters
+    ----------
+    low, high : float
+        limits
+
+    """
+    return low + (high-low)*self.random()
+
+  def uniformarray(self,low,high,shape):
+    """Array of uniform numbers in [low,high), drawn straight from the generator
+
+    Parameters
+    ----------
+    low, high : float or numpy arrays
+        limits, broadcast against shape
+    shape : tuple
+        shape of the array
+
+    """
+    return low + (high-low)*self.generator.random(shape)
+
+  def randint(self,n):
+    """Uniform integer in [0,n)
+
+    Parameters
+    ----------
+    n : int
+        number of choices
+
+    """
+    return int(self.random()*n)
+
+  def spawn(self,n):
+    """Independent streams, e.g. for parallel workers
+
+    Parameters
+    ----------
+    n : int
+        number of streams
+
+    Returns
+    -------
+    seeds : list of numpy.random.SeedSequence
+        seeds of the child streams, pass them to rng()
+
+    """
+    return self.seedseq.spawn(n)
+
+  def getstate(self):
+    """State of the stream, including the unused part of the block
+    The generator state holds 128 bit integers so it is kept as a json string
+    """
+    return {'generator': json.dumps(self.generator.bit_generator.state),
+            'block': np.array(self.block), 'index': self.index}
+
+  def setstate(self,state):
+    """Restore a state from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.generator.bit_generator.state = json.loads(str(state['generator']))
+    self.block = list(np.asarray(state['block']).tolist())
+    self.index = int(state['index'])
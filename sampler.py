@@ -0,0 +1,399 @@
+import numpy as np
+import math as ma
+from tally import blockstats
+class accumulator(object):
+  """Observable fed with blocks of pairs by the sampler
+  Subclasses override whichever of start, addpairs and finish they need
+  """
+  def start(self,parts,vol):
+    """Called before the pairs of a sample
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    vol : float
+        simulation box volume
+
+    """
+    return
+
+  def addpairs(self,imol,jmol,r,r2):
+    """Called for each block of pairs within the cutoff, see energy.pairs
+
+    Parameters
+    ----------
+    imol, jmol : 1d int arrays
+        molecule numbers of each pair
+    r : 2d numpy array (npair, ndim)
+        minimum image separation
+    r2 : 1d numpy array
+        squared separation
+
+    """
+    return
+
+  def finish(self,parts,vol):
+    """Called after the pairs of a sample
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    vol : float
+        simulation box volume
+
+    """
+    return
+
+class energyaccumulator(accumulator):
+  def __init__(self,energy):
+    """Total energy, resets the running total energy.tu, see energy.resettotal
+
+    Parameters
+    ----------
+    energy : class
+       simulation energy information, see energy.py
+
+    """
+    self.energy = energy
+
+  def start(self,parts,vol):
+    self.parts = parts
+    self.u = 0.0
+    self.u12 = 0.0
+
+  def addpairs(self,imol,jmol,r,r2):
+    ptype = self.energy.pairtype(self.parts, imol, jmol)
+    self.u += np.sum(self.energy.pairenergy(r2, ptype))
+    if self.energy.splitsums:
+      self.u12 += np.sum(self.energy.pot.energy12(r2, ptype))
+
+  def finish(self,parts,vol):
+    en = self.energy
+    u12 = 0.0
+    if en.splitsums:
+      u12 = float(self.u12) + en.pot.utail12(en.counts(parts), vol)
+    en.resettotal(float(self.u) + en.pot.utail(en.counts(parts), vol), u12)
+
+class virialaccumulator(accumulator):
+  def __init__(self,energy,tensor=False):
+    """Virial and pressure, and optionally their tensors
+    Sets energy.vir and energy.tp (and energy.virtensor, energy.ptensor)
+
+    Parameters
+    ----------
+    energy : class
+       simulation energy information, see energy.py
+    tensor : bool
+        also accumulate the virial tensor
+
+    """
+    self.energy = energy
+    self.tensor = tensor
+
+  def start(self,parts,vol):
+    self.parts = parts
+    self.vir = 0.0
+    self.virtensor = np.zeros((self.energy.ndim, self.energy.ndim))
+
+  def addpairs(self,imol,jmol,r,r2):
+    ff = self.energy.pairforce(r2, self.energy.pairtype(self.parts, imol, jmol))
+    self.vir += np.dot(ff, r2)
+    if self.tensor:
+      self.virtensor += np.dot(r.T, ff[:,np.newaxis]*r)
+
+  def finish(self,parts,vol):
+    en = self.energy
+    ndim = en.ndim
+    rho = parts.nmol/vol
+    ptail = en.pot.ptail(en.counts(parts)/vol)
+    en.vir = float(self.vir)/ndim
+    en.tp = en.T * rho + en.vir/vol + ptail
+    if self.tensor:
+      en.virtensor = self.virtensor
+      en.ptensor = (en.T * rho + ptail) * np.identity(ndim) + self.virtensor/vol
+
+class rdfaccumulator(accumulator):
+  def __init__(self,rmax,nbins=100,energy=None):
+    """Radial distribution function, histogram of pair distances summed over all samples
+
+    Parameters
+    ----------
+    rmax : float
+        largest distance, pairs beyond the cutoff are never seen
+    nbins : int
+        number of histogram bins
+    energy : class
+        energy of a run whose cutoff changes (NPT, see energy.py), a
+        sample then only counts for the bins inside its cutoff
+
+    self.hist : 1d numpy array
+        number of pairs in each bin, summed over samples
+    self.nideal : 1d numpy array
+        pairs per unit volume of an ideal gas, N(N-1)/2V summed over the
+        samples that cover each bin
+    self.nsamp : int
+        number of samples
+
+    """
+    self.rmax = rmax
+    self.nbins = nbins
+    self.dr = rmax/float(nbins)
+    self.energy = energy
+    self.hist = np.zeros((nbins))
+    self.nideal = np.zeros((nbins))
+    self.ncover = nbins
+    self.rhosum = 0.0
+    self.nsum = 0.0
+    self.nsamp = 0
+
+  def start(self,parts,vol):
+    # bins wholly inside the current cutoff
+    if self.energy is not None:
+      self.ncover = min(int(self.energy.rc/self.dr*(1. + 1e-12)), self.nbins)
+
+  def addpairs(self,imol,jmol,r,r2):
+    ibin = (np.sqrt(r2)/self.dr).astype(int)
+    self.hist += np.bincount(ibin[ibin < self.ncover], minlength=self.nbins)
+
+  def finish(self,parts,vol):
+    nmol = parts.nmol
+    self.nideal[:self.ncover] += 0.5*nmol*(nmol-1)/vol
+    self.rhosum += nmol/vol
+    self.nsum += nmol
+    self.nsamp += 1
+
+  def getstate(self):
+    """Histogram and normalization sums, e.g. for a checkpoint"""
+    return {'hist': self.hist.copy(), 'nideal': self.nideal.copy(), 'rhosum': self.rhosum,
+            'nsum': self.nsum, 'nsamp': self.nsamp}
+
+  def setstate(self,state):
+    """Restore from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.hist = np.array(state['hist'], dtype=float)
+    self.nideal = np.array(state['nideal'], dtype=float)
+    self.rhosum = float(state['rhosum'])
+    self.nsum = float(state['nsum'])
+    self.nsamp = int(state['nsamp'])
+
+  def shellvolumes(self,ndim):
+    """Volume of each histogram shell
+
+    Parameters
+    ----------
+    ndim : int
+        number of simulation dimensions
+
+    Returns
+    -------
+    rmid : 1d numpy array
+        middle of each shell
+    shell : 1d numpy array
+        volume of each shell, 2dr in 1D, the annulus area in 2D
+        and the spherical shell in 3D
+
+    """
+    redge = self.dr*np.arange(self.nbins+1)
+    # volume of a d-sphere of unit radius: 2, pi, 4pi/3
+    unit = ma.pi**(ndim/2.)/ma.gamma(ndim/2. + 1.)
+    shell = unit*(redge[1:]**ndim - redge[:-1]**ndim)
+    return 0.5*(redge[1:] + redge[:-1]), shell
+
+  def gofr(self,ndim):
+    """Normalize the histogram by the ideal gas pair count
+
+    Parameters
+    ----------
+    ndim : int
+        number of simulation dimensions
+
+    Returns
+    -------
+    rmid : 1d numpy array
+        middle of each shell
+    g : 1d numpy array
+        g(r) in each shell
+
+    """
+    rmid, shell = self.shellvolumes(ndim)
+    g = np.zeros((self.nbins))
+    seen = self.nideal > 0
+    g[seen] = self.hist[seen]/(self.nideal[seen]*shell[seen])
+    return rmid, g
+
+  def output(self,ndim,fname='mc'):
+    """Write g(r)
+
+    Parameters
+    ----------
+    ndim : int
+        number of simulation dimensions
+    fname : string
+        out filename beginning
+
+    """
+    rmid, g = self.gofr(ndim)
+    rdffile = open(fname + '.rdf', 'w')
+    if self.nsamp > 0:
+      rdffile.write('# samples %d rho %f N %f\n' % (self.nsamp, self.rhosum/self.nsamp,
+                                                   self.nsum/self.nsamp))
+    rdffile.write('# r g(r)\n')
+    for ibin in range(self.nbins):
+      rdffile.write('%f %f\n' % (rmid[ibin], g[ibin]))
+    rdffile.close()
+
+class widomaccumulator(accumulator):
+  def __init__(self,energy,box,temp,ninsert,stream,species=0):
+    """Widom test molecule insertion for the excess chemical potential
+    mu_ex = -T ln <exp(-U_test/T)>, every sample inserts ninsert test
+    molecules at random positions in the current configuration. The
+    log of the average Boltzmann factor of each sample is found with a
+    log-sum-exp, and the samples are kept relative to self.shift so the
+    factors neither overflow nor underflow
+
+    Parameters
+    ----------
+    energy : class
+       simulation energy information, see energy.py
+    box : class
+       simulation box parameter information, see box.py
+    temp : float
+        temperature
+    ninsert : int
+        test insertions per sample
+    stream : class
+        random number stream of the test insertions, see rng.py; not the
+        stream of the run, or the insertions would change the run
+    species : int
+        species of the test molecules of a mixture
+
+    self.stats : class
+        running statistics of exp(-U_test/T - shift) averaged over each sample
+    self.shift : float
+        log offset of the statistics, None before the first sample
+
+    """
+    self.energy = energy
+    self.box = box
+    self.beta = 1./float(temp)
+    self.T = temp
+    self.ninsert = ninsert
+    self.rng = stream
+    self.species = species
+    self.stats = blockstats(1)
+    self.shift = None
+
+  def finish(self,parts,vol):
+    tpos = self.rng.uniformarray(self.box.box[0,:], self.box.box[1,:],
+                                 (self.ninsert, self.box.ndim))
+    w = -self.beta*self.energy.calcinsertion(parts, tpos, self.species)
+    wmax = np.max(w)
+    if wmax == -np.inf:
+      logmean = -np.inf
+    else:
+      logmean = wmax + ma.log(np.mean(np.exp(w - wmax)))
+    if self.shift is None and logmean > -np.inf:
+      self.shift = logmean
+    elif self.shift is not None and logmean - self.shift > 500.:
+      # rescale the samples so far rather than overflow
+      self.stats.scale(ma.exp(self.shift - logmean))
+      self.shift = logmean
+    if self.shift is None:
+      self.stats.add([0.])
+    else:
+      self.stats.add([ma.exp(logmean - self.shift)])
+
+  def muexcess(self):
+    """Excess chemical potential and its statistical error
+
+    Returns
+    -------
+    muex : float
+        -T ln <exp(-U_test/T)>
+    err : float
+        error from block averaging the samples
+
+    """
+    mean = self.stats.average()[0]
+    if self.shift is None or not mean > 0:
+      return np.inf, np.nan
+    err = self.stats.error()[0]
+    return -self.T*(ma.log(mean) + self.shift), self.T*err/mean
+
+  def getstate(self):
+    """Running sums, e.g. for a checkpoint"""
+    state = self.stats.getstate()
+    state['shift'] = np.nan if self.shift is None else self.shift
+    return state
+
+  def setstate(self,state):
+    """Restore from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.stats.setstate(state)
+    shift = float(state['shift'])
+    self.shift = None if np.isnan(shift) else shift
+
+class sampler(object):
+  def __init__(self,energy):
+    """Initiate single-pass sampler
+    Every sample walks the pairs once and hands each block of pairs to
+    all accumulators, so adding an observable does not add a pass
+
+    Parameters
+    ----------
+    energy : class
+       simulation energy information, see energy.py
+
+    """
+    self.energy = energy
+    self.accumulators = []
+
+  def add(self,acc):
+    """Add an accumulator
+
+    Parameters
+    ----------
+    acc : class
+        an accumulator (see accumulator above)
+
+    Returns
+    -------
+    acc : class
+        the same accumulator
+
+    """
+    self.accumulators.append(acc)
+    return acc
+
+  def sample(self,parts,vol):
+    """Take one sample
+
+    Parameters
+    ----------
+    parts : class
+        particle store, see particles.py
+    vol : float
+        simulation box volume
+
+    """
+    for acc in self.accumulators:
+      acc.start(parts, vol)
+    for imol, jmol, r, r2 in self.energy.pairs(parts):
+      for acc in self.accumulators:
+        acc.addpairs(imol, jmol, r, r2)
+    for acc in self.accumulators:
+      acc.finish(parts, vol)
@@ -0,0 +1,315 @@
+import math as ma
+import numpy as np
+from box import box
+from checkpoint import checkpoint
+from configs import configfile
+from configs import trajectory
+from configs import initialize
+from configs import movie
+from energy import energy
+from moves import moves
+from profiler import profiler
+from rng import rng
+from sampler import sampler, energyaccumulator, virialaccumulator, rdfaccumulator, widomaccumulator
+from tally import tally
+
+class simulation(object):
+  def __init__(self,inp,samplefname=None):
+    """Set up a simulation from its inputs
+
+    Parameters
+    ----------
+    inp : class
+       simulation inputs, see input.py
+    samplefname : string
+       out filename beginning of the samples, defaults to inp.fname
+
+    self.bx : class
+       simulation box, see box.py
+    self.en : class
+       energy, see energy.py
+    self.parts : class
+       particle store, see particles.py
+    self.rng : class
+       random number stream of the run, see rng.py
+    self.mv : class
+       moves, see moves.py
+    self.io : class
+       sample tallies, see tally.py
+    self.smp : class
+       single-pass sampler of the pair observables, see sampler.py
+    self.chk : class
+       checkpoint file, see checkpoint.py
+    self.perf : class
+       phase timings and progress lines, see profiler.py, None when off
+
+    """
+    self.inp = inp
+    self.rng = rng(inp.seed)
+    self.bx = box()
+    self.bx.setedges(inp.boxlength)
+
+    self.en = energy(inp.nmol, self.bx, inp.T)
+    self.en.setparameters(inp.sigma,inp.epsilon,inp.rc,inp.potential,inp.tabletol,
+                          inp.mixing,inp.overrides)
+
+    if inp.muVT:
+      init = initialize(inp.max_nmol, self.rng)
+    else:
+      init = initialize(inp.nmol, self.rng)
+    self.parts = init.random(inp.nmol, self.bx)
+    if inp.nspecies > 1:
+      # the first molecules are species 0 and so on, in the ratios of inp.fractions
+      edges = np.round(np.cumsum(inp.fractions)/np.sum(inp.fractions)*inp.nmol).astype(int)
+      self.parts.setspecies(inp.nspecies, np.searchsorted(edges, np.arange(inp.nmol), side='right'))
+    if inp.usecells:
+      self.bx.setcells(inp.rc, self.parts)
+    if inp.skin > 0:
+      self.en.setverlet(inp.skin, self.parts)
+
+    # Set up move
+    self.mv = moves(self.parts,self.bx,self.en,inp.T,inp.mu,self.rng)
+    self.mv.setmovemix(inp.frac_displacement,inp.frac_insdel)
+    self.mv.settranslation(inp.maxdisp,inp.targetaccept)
+    self.mv.setcavity(inp.rcavity)
+    if inp.NPT:
+      self.mv.setvolume(inp.P, inp.dlnv, inp.targetaccept)
+    if inp.gibbs:
+      # volume exchanges rescale the energy, see gibbs.py
+      self.en.splitsums = True
+
+    if inp.make_movie:
+      self.mov = movie(inp.sigma,self.bx)
+      self.mov.update(self.parts)
+
+    self.en.calcfullenergy(self.parts)
+    self.openoutput(inp.fname if samplefname is None else samplefname)
+    self.chk = checkpoint(inp.fname)
+    self.perf = None
+    if inp.profile or inp.nprogress > 0:
+      self.perf = profiler(inp.profile, inp.nprogress)
+      self.perf.attach(self)
+
+  def openoutput(self,fname):
+    """Set up the sampler and the sample output files
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning of the samples
+
+    self.smp : class
+       single-pass sampler of the pair observables, see sampler.py
+    self.rdf, self.widom : class
+       g(r) and Widom accumulators of the sampler, see sampler.py
+    self.config : class
+       configuration output, see configs.py
+    self.io : class
+       sample tallies, see tally.py
+
+    """
+    inp = self.inp
+    self.smp = sampler(self.en)
+    self.smp.add(energyaccumulator(self.en))
+    self.smp.add(virialaccumulator(self.en, self.en.calctensor))
+    self.rdf = self.smp.add(rdfaccumulator(self.en.rc, inp.nrdfbins,
+                                           self.en if inp.NPT or inp.gibbs else None))
+    self.widom = None
+    if inp.nwidom > 0:
+      # test insertions draw from a stream of their own so they leave the run unchanged
+      self.widom = self.smp.add(widomaccumulator(self.en, self.bx, inp.T, inp.nwidom,
+                                                 rng(self.rng.spawn(1)[0])))
+    self.config = None
+    if inp.writeconfigs:
+      if inp.configformat == 'xyz':
+        self.config = configfile(inp.ndim, fname, inp.restart)
+      else:
+        self.config = trajectory(inp.ndim, fname, inp.configformat, inp.restart)
+    self.io = tally(fname, inp.restart, inp.onlinestats, inp.nspecies)
+
+  def getoutput(self):
+    """The sampler and sample outputs, see openoutput"""
+    return (self.smp, self.rdf, self.widom, self.config, self.io)
+
+  def setoutput(self,output):
+    """Switch to other sample outputs
+
+    Parameters
+    ----------
+    output : tuple
+        from getoutput
+
+    """
+    self.smp, self.rdf, self.widom, self.config, self.io = output
+
+  def settemperature(self,T):
+    """Change the temperature, e.g. after a replica exchange
+
+    Parameters
+    ----------
+    T : float
+        temperature
+
+    """
+    self.inp.T = T
+    self.en.T = T
+    self.mv.beta = 1./T
+    self.mv.expbetamus = [ma.exp(self.mv.beta*value) for value in np.ravel(self.inp.mu)]
+    self.mv.setspecies(self.mv.species)
+    if self.widom is not None:
+      self.widom.T = T
+      self.widom.beta = 1./T
+
+  def run(self,start=0,nmoves=None):
+    """Do MC moves, sampling along the way
+
+    Parameters
+    ----------
+    start : int
+        number of the first move
+    nmoves : int
+        number of moves, defaults to the rest of inp.nmoves
+
+    """
+    inp = self.inp
+    if nmoves is None:
+      nmoves = inp.nmoves - start
+    for imove in range(start, start + nmoves):
+      # on average one volume move per sweep of N molecule moves
+      if inp.NPT and self.rng.random() < 1./(self.mv.nmol + 1):
+        self.mv.volumemove()
+      else:
+        self.mv.move()
+      if imove < inp.nmovesequil:
+        self.mv.tune(imove)
+        if inp.NPT:
+          self.mv.tunevolume(imove)
+      if inp.ndriftcheck > 0 and ((imove+1) % inp.ndriftcheck) == 0:
+        self.en.checkdrift(self.parts, imove)
+      if (imove % inp.nsample) == 0 and (imove > inp.nmovesequil):
+        self.sample(imove)
+      if inp.ncheckpoint > 0 and ((imove+1) % inp.ncheckpoint) == 0:
+        self.chk.write(self.getstate(imove+1))
+
+  def sample(self,imove):
+    """Sample the observables and write the configuration
+
+    Parameters
+    ----------
+    imove : int
+        MC move number
+
+    """
+    # energy, pressure and g(r) come from one pass over the pairs
+    self.smp.sample(self.parts, self.mv.vol)
+    if self.inp.writeconfigs:
+      self.config.writeframe(imove, self.parts)
+    self.io.update(imove, self.en, self.mv)
+
+  def getstate(self,step):
+    """Copy of the full simulation state
+
+    Parameters
+    ----------
+    step : int
+        number of the next move
+
+    Returns
+    -------
+    state : dictionary of dictionaries
+        state of each part, see checkpoint.py
+
+    """
+    state = {'run': {'step': step},
+             'box': {'edges': self.bx.boxlength.copy()},
+             'parts': self.parts.getstate(),
+             'rng': self.rng.getstate(),
+             'energy': self.en.getstate(),
+             'moves': self.mv.getstate(),
+             'tally': self.io.getstate(),
+             'rdf': self.rdf.getstate()}
+    if self.bx.cells is not None:
+      state['cells'] = self.bx.cells.getstate()
+    if self.en.verlet is not None:
+      state['verlet'] = self.en.verlet.getstate()
+    if self.inp.writeconfigs:
+      state['config'] = self.config.getstate()
+    if self.widom is not None:
+      state['widom'] = self.widom.getstate()
+      state['widomrng'] = self.widom.rng.getstate()
+    return state
+
+  def restart(self):
+    """Continue from the checkpoint, output written after it is dropped
+
+    Returns
+    -------
+    step : int
+        number of the next move
+
+    """
+    state = self.chk.read()
+    if self.inp.NPT:
+      self.mv.resize(state['box']['edges'])
+    if self.en.verlet is not None:
+      self.en.verlet.setstate(state['verlet'])
+    self.parts.setstate(state['parts'])
+    if self.bx.cells is not None:
+      self.bx.cells.setstate(state['cells'])
+    self.rng.setstate(state['rng'])
+    self.en.setstate(state['energy'])
+    self.mv.setstate(state['moves'])
+    self.io.setstate(state['tally'])
+    self.rdf.setstate(state['rdf'])
+    if self.inp.writeconfigs:
+      self.config.setstate(state['config'])
+    if self.widom is not None:
+      self.widom.setstate(state['widom'])
+      self.widom.rng.setstate(state['widomrng'])
+    return int(state['run']['step'])
+
+  def closeoutput(self,fname):
+    """Write the averages and g(r) of the samples and close their files
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning of the samples, see openoutput
+
+    """
+    inp = self.inp
+    self.io.close()
+    self.io.average()
+    # io.pltseries()
+    muex = self.widom.muexcess() if self.widom is not None else None
+    if inp.muVT:
+      self.io.outputave(inp.T, fname,inp.mu,muex)
+    else:
+      self.io.outputave(inp.T, fname,muex=muex)
+    self.rdf.output(self.bx.ndim, fname)
+    if self.config is not None:
+      self.config.close()
+
+  def finish(self,samples=True):
+    """Write the averages and the run statistics
+
+    Parameters
+    ----------
+    samples : bool
+        also write the averages of the samples and close their files,
+        see closeoutput
+
+    """
+    inp = self.inp
+    self.chk.wait()
+    if inp.make_movie:
+      self.mov.update(self.parts)
+    if samples:
+      self.closeoutput(inp.fname)
+    self.mv.outputefficiency(inp.fname)
+    self.mv.outputtuning(inp.fname)
+    self.en.outputdrift(inp.fname)
+    if self.en.verlet is not None:
+      self.en.verlet.output(inp.nmoves, inp.fname)
+    if inp.profile:
+      self.perf.output(self.mv, inp.fname)
@@ -0,0 +1,121 @@
+# batch parameter sweep (isotherms, equations of state) for the monte carlo code
+import sys, os, copy, itertools
+import multiprocessing as mp
+from input import inputs
+from main_mc import commandline
+from rng import rng
+from simulation import simulation
+
+# command line options that may hold a comma separated list of values
+gridkeys = [('mu', 'mu'), ('temperature', 'T'), ('V', 'V'), ('N', 'N')]
+
+def runpoint(inp):
+  """Run one state point in a worker process
+
+  Parameters
+  ----------
+  inp : class
+     simulation inputs of the point, see input.py
+
+  Returns
+  -------
+  fname : string
+      output file name root of the point
+
+  """
+  sim = simulation(inp)
+  sim.run()
+  sim.finish()
+  return inp.fname
+
+def finished(fname):
+  """Check whether a state point already wrote its averages
+
+  Parameters
+  ----------
+  fname : string
+      output file name root of the point
+
+  """
+  if not os.path.exists(fname + '.ave'):
+    return False
+  with open(fname + '.ave') as avefile:
+    return len(avefile.readlines()) == 2
+
+class sweep(object):
+  def __init__(self,parser,args):
+    """Initiate a sweep over a grid of state points
+
+    Parameters
+    ----------
+    parser : an ArgParser.parser
+        Carries command-line information, see main_mc.commandline
+    args : an argparse.Namespace
+        parsed arguments, the grid options may be comma separated lists;
+        every point gets its own random stream spawned from --seed, which
+        does not depend on the number of workers
+
+    self.points : list of classes
+        inputs of every state point
+
+    """
+    self.fname = args.outfile if args.outfile != 'read' else 'mc'
+    values = [str(getattr(args, key)).split(',') for key, label in gridkeys]
+    grid = list(itertools.product(*values))
+    seeds = rng(None if args.seed == 'read' else int(args.seed)).spawn(len(grid))
+    self.points = []
+    for state, sseq in zip(grid, seeds):
+      pargs = copy.copy(args)
+      name = self.fname
+      for (key, label), value in zip(gridkeys, state):
+        setattr(pargs, key, value)
+        if value != 'read':
+          name += '_%s%s' % (label, value)
+      pargs.outfile = name
+      inp = inputs()
+      inp.readcommandline(parser, pargs)
+      inp.seed = sseq
+      self.points.append(inp)
+
+  def run(self,nprocs=None):
+    """Run the unfinished state points across a process pool
+
+    Parameters
+    ----------
+    nprocs : int
+        number of worker processes, defaults to the number of cores
+
+    """
+    todo = [inp for inp in self.points if not finished(inp.fname)]
+    if len(todo) > 0:
+      with mp.Pool(nprocs) as pool:
+        for fname in pool.imap_unordered(runpoint, todo):
+          print('finished %s' % fname)
+    self.combine()
+
+  def combine(self):
+    """Collect the averages of all finished points in one table"""
+    sweepfile = open(self.fname + '.sweep', 'w')
+    header = None
+    for inp in self.points:
+      if not finished(inp.fname):
+        continue
+      with open(inp.fname + '.ave') as avefile:
+        lines = avefile.readlines()
+      if header is None:
+        header = lines[0]
+        sweepfile.write('# point ' + header[2:])
+      sweepfile.write('%s %s' % (inp.fname, lines[1]))
+    sweepfile.close()
+
+def main(argv=None):
+  parser = commandline('Parameter sweep of MC runs, comma separated values of '
+                       '-V, -N, -T and --mu are run on a grid')
+  parser.add_argument("--processes", type=int, default=None,
+                 help='number of worker processes, defaults to the number of cores')
+  args = parser.parse_args()
+  sw = sweep(parser, args)
+  sw.run(args.processes)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,234 @@
 import numpy as np
 import math as ma
 import matplotlib.pyplot as plt
+class samplefile(object):
+  def __init__(self,fname,header,fmt,nbuffer=1024,append=False):
+    """Initiate buffered sample file
+    Samples are kept in a preallocated array and written as a block of
+    text lines when it is full, so the file only ever holds whole lines
+    and can be read while the run is going
+
+    Parameters
+    ----------
+    fname : string
+       file name
+    header : string
+       first line of the file, without the newline
+    fmt : list of strings
+       format of each column
+    nbuffer : int
+       samples kept before a write
+    append : bool
+       continue an existing file, e.g. on restart
+
+    self.buffer : 2d numpy array (nbuffer, ncol)
+        samples not yet written, only the first self.nbuffered rows are used
+
+    """
+    self.fmt = ' '.join(fmt)
+    self.buffer = np.zeros((nbuffer, len(fmt)))
+    self.nbuffered = 0
+    if append:
+      self.file = open(fname, 'a')
+    else:
+      self.file = open(fname, 'w')
+      self.file.write(header + '\n')
+
+  def add(self,row):
+    """Add one sample
+
+    Parameters
+    ----------
+    row : list of floats
+        value of each column
+
+    """
+    self.buffer[self.nbuffered] = row
+    self.nbuffered += 1
+    if self.nbuffered == len(self.buffer):
+      self.flush()
+
+  def flush(self):
+    """Write the buffered samples"""
+    if self.nbuffered > 0:
+      np.savetxt(self.file, self.buffer[:self.nbuffered], fmt=self.fmt)
+      self.nbuffered = 0
+    self.file.flush()
+
+  def tell(self):
+    """Length of the file after writing the buffered samples"""
+    self.flush()
+    return self.file.tell()
+
+  def truncate(self,offset):
+    """Drop everything after offset, buffered samples included"""
+    self.nbuffered = 0
+    self.file.truncate(offset)
+
+  def close(self):
+    self.flush()
+    self.file.close()
+
+class blockstats(object):
+  def __init__(self,nprop):
+    """Initiate online statistics of a set of properties
+    Running moments use Welford's update, and the samples are averaged in
+    pairs, the pairs in pairs and so on (Flyvbjerg and Petersen blocking)
+    with Welford moments of the block averages at every level, so the
+    memory grows only with the log of the number of samples
+
+    Parameters
+    ----------
+    nprop : int
+        number of properties in every sample
+
+    self.count : list of ints
+        number of blocks of 2**level samples
+    self.mean : list of 1d numpy arrays
+        running mean of the blocks at each level
+    self.m2 : list of 1d numpy arrays
+        running sum of squared deviations of the blocks at each level
+    self.pending : list of 1d numpy arrays or None
+        block waiting for its partner at each level
+
+    """
+    self.nprop = nprop
+    self.count = []
+    self.mean = []
+    self.m2 = []
+    self.pending = []
+
+  def add(self,x):
+    """Add one sample
+
+    Parameters
+    ----------
+    x : 1d numpy array with length nprop
+        properties of the sample
+
+    """
+    x = np.array(x, dtype=float)
+    level = 0
+    while x is not None:
+      if level == len(self.count):
+        self.count.append(0)
+        self.mean.append(np.zeros((self.nprop)))
+        self.m2.append(np.zeros((self.nprop)))
+        self.pending.append(None)
+      self.count[level] += 1
+      delta = x - self.mean[level]
+      self.mean[level] += delta/self.count[level]
+      self.m2[level] += delta*(x - self.mean[level])
+      if self.pending[level] is None:
+        self.pending[level] = x
+        x = None
+      else:
+        x = 0.5*(self.pending[level] + x)
+        self.pending[level] = None
+      level += 1
+
+  @property
+  def nsamp(self):
+    return self.count[0] if len(self.count) > 0 else 0
+
+  def average(self):
+    """Mean of every property"""
+    if self.nsamp == 0:
+      return np.zeros((self.nprop)) + np.nan
+    return self.mean[0].copy()
+
+  def std(self):
+    """Standard deviation of every property"""
+    if self.nsamp == 0:
+      return np.zeros((self.nprop)) + np.nan
+    return np.sqrt(self.m2[0]/self.nsamp)
+
+  def blockerrors(self):
+    """Standard error of the mean estimated from the blocks of each level
+
+    Returns
+    -------
+    errors : 2d numpy array (nlevel, nprop)
+        error estimate of each level, levels with fewer than 2 blocks are left out
+
+    """
+    errors = []
+    for level in range(len(self.count)):
+      n = self.count[level]
+      if n < 2:
+        break
+      errors.append(np.sqrt(self.m2[level]/n/(n - 1)))
+    return np.array(errors).reshape((-1, self.nprop))
+
+  def error(self):
+    """Standard error of the mean accounting for correlation between samples
+    For each property the first level whose blocks are long enough by the
+    criterion of Lee et al. (B^3 > 2 n (err_B/err_0)^4, B the block size)
+    is used; if no level qualifies the largest error is used
+
+    """
+    errors = self.blockerrors()
+    if len(errors) == 0:
+      return np.zeros((self.nprop)) + np.nan
+    err = np.max(errors, axis=0)
+    found = np.zeros((self.nprop), dtype=bool)
+    n = float(self.nsamp)
+    for level in range(len(errors)):
+      ratio = np.zeros((self.nprop))
+      nonzero = errors[0] > 0
+      ratio[nonzero] = errors[level][nonzero]/errors[0][nonzero]
+      ok = (2.**level)**3 > 2*n*ratio**4
+      use = ok & ~found
+      err[use] = errors[level][use]
+      found |= ok
+    return err
+
+  def scale(self,factor):
+    """Multiply every sample so far by factor
+
+    Parameters
+    ----------
+    factor : float
+        scale factor
+
+    """
+    for level in range(len(self.count)):
+      self.mean[level] *= factor
+      self.m2[level] *= factor*factor
+      if self.pending[level] is not None:
+        self.pending[level] *= factor
+
+  def getstate(self):
+    """Copy of the running sums, e.g. for a checkpoint"""
+    nlevel = len(self.count)
+    pending = np.zeros((nlevel, self.nprop))
+    haspending = np.zeros((nlevel), dtype=bool)
+    for level in range(nlevel):
+      if self.pending[level] is not None:
+        pending[level] = self.pending[level]
+        haspending[level] = True
+    return {'count': np.array(self.count, dtype=int),
+            'mean': np.array(self.mean).reshape((nlevel, self.nprop)),
+            'm2': np.array(self.m2).reshape((nlevel, self.nprop)),
+            'pending': pending, 'haspending': haspending}
+
+  def setstate(self,state):
+    """Restore from getstate
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.count = np.asarray(state['count']).tolist()
+    self.mean = [row.copy() for row in np.asarray(state['mean'])]
+    self.m2 = [row.copy() for row in np.asarray(state['m2'])]
+    self.pending = [row.copy() if has else None
+                    for row, has in zip(np.asarray(state['pending']), state['haspending'])]
+
 class tally(object):
-  def __init__(self,filename='mc'):
+  def __init__(self,filename='mc',append=False,online=False,nspecies=1):
     """Initiate tally class
     Used for keeping track of averages also
 
@@ -10,10 +236,26 @@ class tally(object):
     ----------
     filename : string
        name of output file
+    append : bool
+       continue an existing file, e.g. on restart
+    online : bool
+       only keep running statistics instead of every sample, the
+       memory then does not grow with the length of the run
+    nspecies : int
+       number of species, a mixture also tallies N and rho of each species
+
+    self.stats : class
+       running statistics of P, U, V, N and rho, followed for a mixture
+       by N and rho of each species, see blockstats above
 
     """
-    self.file = open(filename + '.data', 'w')
-    self.file.write("# step P U V N\n")
+    self.nspecies = nspecies
+    header = "# step P U V N"
+    fmt = ['%d', '%f', '%f', '%f', '%f', '%f']
+    if nspecies > 1:
+      header += ''.join([' N%d' % ispecies for ispecies in range(nspecies)])
+      fmt += ['%d']*nspecies
+    self.file = samplefile(filename + '.data', header, fmt, append=append)
     self.step = []
     self.p = []
     self.u = []
@@ -21,6 +263,8 @@ class tally(object):
     self.n = []
     self.rho = []
     self.nsamp = 0
+    self.online = online
+    self.stats = blockstats(5 + 2*nspecies if nspecies > 1 else 5)
 
   def average(self):
     """Average and get standard deviation for all properties
@@ -33,8 +277,25 @@ class tally(object):
        average pressure thus far
     self.pstd : float
        average pressure standard devation thus far
+    self.perr : float
+       statistical error of the average pressure from block averaging
 
     """
+    errors = self.stats.error()
+    self.perr, self.uerr, self.verr, self.nerr, self.rhoerr = errors[:5]
+    if self.nspecies > 1:
+      # N and rho of each species, always from the running statistics
+      ns = self.nspecies
+      average = self.stats.average()
+      std = self.stats.std()
+      self.nspecave, self.rhospecave = average[5:5+ns], average[5+ns:]
+      self.nspecstd, self.rhospecstd = std[5:5+ns], std[5+ns:]
+      self.nspecerr, self.rhospecerr = errors[5:5+ns], errors[5+ns:]
+    if self.online:
+      self.pave, self.uave, self.vave, self.nave, self.rhoave = self.stats.average()[:5]
+      self.pstd, self.ustd, self.vstd, self.nstd, self.rhostd = self.stats.std()[:5]
+      return
+
     self.p = np.array(self.p)
     self.u = np.array(self.u)
     self.v = np.array(self.v)
@@ -72,14 +333,51 @@ class tally(object):
     V = move.vol
     N = move.nmol
     rho = N / V
+    if self.nspecies > 1:
+      nspec = move.parts.nmolspecies
+      self.stats.add([P, U, V, N, rho] + list(nspec) + list(nspec/V))
+      self.file.add([istep, P, U, rho, V, N] + list(nspec))
+    else:
+      self.stats.add([P, U, V, N, rho])
+      self.file.add([istep, P, U, rho, V, N])
+    if self.online:
+      return
     self.step.append(istep)
     self.p.append(P)
     self.u.append(U)
     self.v.append(V)
     self.n.append(N)
     self.rho.append(rho)
-    self.file.write('%d %f %f %f %f %f\n' % (istep, P, U, rho, V, N))
     
+  def getstate(self):
+    """Samples so far and the length of the .data file, e.g. for a checkpoint"""
+    state = {'step': np.array(self.step), 'p': np.array(self.p), 'u': np.array(self.u),
+             'v': np.array(self.v), 'n': np.array(self.n), 'rho': np.array(self.rho),
+             'nsamp': self.nsamp, 'offset': self.file.tell()}
+    for key, value in self.stats.getstate().items():
+      state['stats_' + key] = value
+    return state
+
+  def setstate(self,state):
+    """Restore from getstate, dropping lines written after it
+
+    Parameters
+    ----------
+    state : dictionary
+        from getstate
+
+    """
+    self.step = np.asarray(state['step']).tolist()
+    self.p = np.asarray(state['p']).tolist()
+    self.u = np.asarray(state['u']).tolist()
+    self.v = np.asarray(state['v']).tolist()
+    self.n = np.asarray(state['n']).tolist()
+    self.rho = np.asarray(state['rho']).tolist()
+    self.nsamp = int(state['nsamp'])
+    self.stats.setstate(dict([(key[len('stats_'):], state[key]) for key in state
+                              if key.startswith('stats_')]))
+    self.file.truncate(int(state['offset']))
+
   def pltseries(self):
     """Plot functions
     """
@@ -88,7 +386,7 @@ class tally(object):
     plt.ylabel('P')
     plt.show()
 
-  def outputave(self, T, fname='mc', mu='off'):
+  def outputave(self, T, fname='mc', mu='off', muex=None):
     """Write the averages with the standard devations
 
     Parameters
@@ -97,16 +395,46 @@ class tally(object):
        temperature 
     fname : string
         out filename beginning
-    mu : either a string or a float
-        if we are running a muVT sim this will be a float and the output changes accordingly
+    mu : either a string, a float or a list of floats
+        if we are running a muVT sim this will be a float (one per species
+        for a mixture) and the output changes accordingly
+    muex : tuple of floats
+        excess chemical potential and its error from Widom insertions, added
+        with the total mu_ideal + mu_ex and its error
 
     """
     ofile = open(fname + '.ave', 'w')
     ofile.write("# ")
     if mu != 'off':
-      ofile.write("mu ")
-    ofile.write("T rho P U N V mu_ideal, stds\n")
+      if np.ndim(mu) > 0:
+        ofile.write(''.join(['mu%d ' % ispecies for ispecies in range(len(mu))]))
+      else:
+        ofile.write("mu ")
+    ofile.write("T rho P U N V mu_ideal, stds, errors")
+    if muex is not None:
+      ofile.write(", mu_ex mu_ex_err mu_widom mu_widom_err")
+    if self.nspecies > 1:
+      ofile.write(", N rho mu_ideal of each species, their stds, their errors")
+    ofile.write("\n")
     if mu != 'off': 
-      ofile.write('%f ' % mu)
-    ofile.write('%f %f %f %f %f %f %f %f %f %f %f %f %f\n' % (T, self.rhoave, self.pave, self.uave, self.nave, self.vave, -T*ma.log(1./self.rhoave),
+      ofile.write(''.join(['%f ' % value for value in np.ravel(mu)]))
+    ofile.write('%f %f %f %f %f %f %f %f %f %f %f %f %f' % (T, self.rhoave, self.pave, self.uave, self.nave, self.vave, -T*ma.log(1./self.rhoave),
                                                            self.rhostd, self.pstd, self.ustd, self.nstd, self.vstd, T*self.rhostd/self.rhoave))
+    ofile.write(' %f %f %f %f %f %f' % (self.rhoerr, self.perr, self.uerr, self.nerr, self.verr, T*self.rhoerr/self.rhoave))
+    if muex is not None:
+      mutot = -T*ma.log(1./self.rhoave) + muex[0]
+      muerr = ma.sqrt((T*self.rhoerr/self.rhoave)**2. + muex[1]**2.)
+      ofile.write(' %f %f %f %f' % (muex[0], muex[1], mutot, muerr))
+    if self.nspecies > 1:
+      rho = np.maximum(self.rhospecave, 1e-300)
+      for values in [(self.nspecave, self.rhospecave, T*np.log(rho)),
+                     (self.nspecstd, self.rhospecstd, T*self.rhospecstd/rho),
+                     (self.nspecerr, self.rhospecerr, T*self.rhospecerr/rho)]:
+        for ispecies in range(self.nspecies):
+          ofile.write(' %f %f %f' % tuple([value[ispecies] for value in values]))
+    ofile.write('\n')
+    ofile.close()
+
+  def close(self):
+    """Write the remaining samples and close the .data file"""
+    self.file.close()
@@ -0,0 +1,236 @@
+# parallel tempering (replica exchange) driver for the monte carlo code
+import sys, copy
+import math as ma
+import multiprocessing as mp
+import numpy as np
+from input import inputs
+from main_mc import commandline
+from rng import rng
+from simulation import simulation
+
+def samplename(fname,T):
+  """Out filename beginning of the samples of a replica at temperature T"""
+  return '%s_T%g' % (fname, T)
+
+def replica(inp,conn):
+  """Run one replica in its own process, driven by messages from the exchange driver
+  The configuration stays with the replica, an exchange only changes its
+  temperature. The samples of every temperature it visits go to their
+  own output files (see samplename), the move statistics are per replica
+
+  Parameters
+  ----------
+  inp : class
+     simulation inputs of this replica, see input.py
+  conn : multiprocessing connection
+     pipe to the driver
+
+  """
+  sim = simulation(inp, samplename(inp.fname, inp.T))
+  outputs = {inp.T: sim.getoutput()}
+  while True:
+    task = conn.recv()
+    if task[0] == 'run':
+      sim.run(task[1], task[2])
+      conn.send((sim.en.tu, np.copy(sim.en.counts(sim.parts)), sim.mv.vol))
+    elif task[0] == 'temperature':
+      T = task[1]
+      sim.settemperature(T)
+      if T not in outputs:
+        sim.openoutput(samplename(inp.fname, T))
+        outputs[T] = sim.getoutput()
+      sim.setoutput(outputs[T])
+    elif task[0] == 'finish':
+      # number of samples, averages and errors at each temperature
+      summary = {}
+      for T, output in outputs.items():
+        sim.setoutput(output)
+        sim.settemperature(T)
+        if sim.io.nsamp == 0:
+          # only visited during equilibration
+          sim.io.close()
+          if sim.config is not None:
+            sim.config.close()
+          continue
+        sim.closeoutput(samplename(inp.fname, T))
+        io = sim.io
+        summary[T] = (io.nsamp, [io.uave, io.pave, io.vave, io.rhoave, io.nave],
+                      [io.uerr, io.perr, io.verr, io.rhoerr, io.nerr])
+      sim.finish(samples=False)
+      conn.send(summary)
+      return
+
+class tempering(object):
+  def __init__(self,inp,temps,nswap):
+    """Initiate replica exchange driver
+    One replica per temperature, each with its own random stream spawned
+    from inp.seed. Replicas keep their configurations and trade
+    temperatures, see replica for their output files
+
+    Parameters
+    ----------
+    inp : class
+       simulation inputs shared by all replicas, see input.py
+    temps : list of floats
+        temperatures, neighbors in the list attempt swaps
+    nswap : int
+        MC moves of every replica between swap attempts
+
+    self.replica : list of ints
+        replica at each temperature, replica i starts at temps[i]
+    self.nattempt : 1d array
+        number of attempted swaps between temperature i and i+1
+    self.naccept : 1d array
+        number of accepted swaps between temperature i and i+1
+
+    """
+    self.inp = inp
+    self.temps = list(temps)
+    self.nrep = len(self.temps)
+    self.nswap = nswap
+    seeds = rng(inp.seed).spawn(self.nrep + 1)
+    # the last stream decides the swaps
+    self.rng = rng(seeds[-1])
+    self.inps = []
+    for T, seed in zip(self.temps, seeds):
+      rinp = copy.deepcopy(inp)
+      rinp.T = T
+      rinp.seed = seed
+      rinp.fname = '%s_r%d' % (inp.fname, len(self.inps))
+      self.inps.append(rinp)
+    self.beta = np.array([1./T for T in self.temps])
+    self.replica = list(range(self.nrep))
+    self.nattempt = np.zeros((max(self.nrep-1, 0)))
+    self.naccept = np.zeros((max(self.nrep-1, 0)))
+
+  def run(self):
+    """Run all replicas in parallel, attempting swaps every nswap moves"""
+    conns = []
+    procs = []
+    for rinp in self.inps:
+      conn, child = mp.Pipe()
+      proc = mp.Process(target=replica, args=(rinp, child))
+      proc.start()
+      conns.append(conn)
+      procs.append(proc)
+
+    mapfile = open(self.inp.fname + '.replicas', 'w')
+    mapfile.write('# step, temperature of each replica\n')
+    iswap = 0
+    for start in range(0, self.inp.nmoves, self.nswap):
+      nmoves = min(self.nswap, self.inp.nmoves - start)
+      for conn in conns:
+        conn.send(('run', start, nmoves))
+      state = [conn.recv() for conn in conns]
+      self.exchange(conns, state, iswap)
+      iswap += 1
+      temps = np.zeros((self.nrep))
+      temps[self.replica] = self.temps
+      mapfile.write('%d %s\n' % (start + nmoves, ' '.join(['%g' % T for T in temps])))
+    mapfile.close()
+
+    for conn in conns:
+      conn.send(('finish',))
+    summaries = []
+    for conn, proc in zip(conns, procs):
+      summaries.append(conn.recv())
+      proc.join()
+    self.outputswaps(self.inp.fname)
+    self.outputtemps(summaries, self.inp.fname)
+
+  def exchange(self,conns,state,iswap):
+    """Attempt swaps between neighboring temperatures
+    Even and odd pairs take turns so each replica is in at most one swap.
+    The replicas of an accepted swap trade temperatures, only the new
+    temperature goes through the pipes. With H = U + PV - mu N (P and mu
+    the same at every temperature) a swap is accepted with
+      min(1, exp((beta_i - beta_j)(H_i - H_j)))
+
+    Parameters
+    ----------
+    conns : list of multiprocessing connections
+        pipes to the replicas
+    state : list of (float, int, float)
+        energy, number of molecules (of each species for a mixture) and
+        volume of each replica
+    iswap : int
+        swap attempt number
+
+    """
+    mu = self.inp.mu
+    pressure = self.inp.P if self.inp.NPT else 0.
+    for i in range(iswap % 2, self.nrep-1, 2):
+      j = i + 1
+      ri, rj = self.replica[i], self.replica[j]
+      ui, ni, vi = state[ri]
+      uj, nj, vj = state[rj]
+      delta = (self.beta[i]-self.beta[j])*(ui-uj + pressure*(vi-vj) - float(np.dot(mu, ni-nj)))
+      self.nattempt[i] += 1
+      if delta >= 0 or self.rng.random() < ma.exp(delta):
+        conns[ri].send(('temperature', self.temps[j]))
+        conns[rj].send(('temperature', self.temps[i]))
+        self.replica[i], self.replica[j] = rj, ri
+        self.naccept[i] += 1
+
+  def outputswaps(self, fname='mc'):
+    """Output the swap acceptance between each pair of temperatures
+
+    Parameters
+    ----------
+    fname : string
+        out filename beginning
+
+    """
+    swapfile = open(fname + '.swaps', 'w')
+    swapfile.write('# T_i T_j attempts accepted fa_swap\n')
+    for i in range(self.nrep-1):
+      if self.nattempt[i] > 0:
+        ratio = self.naccept[i]/float(self.nattempt[i])
+      else:
+        ratio = 0
+      swapfile.write('%f %f %d %d %f\n' % (self.temps[i], self.temps[i+1],
+                                          self.nattempt[i], self.naccept[i], ratio))
+    swapfile.close()
+
+  def outputtemps(self, summaries, fname='mc'):
+    """Output the averages at each temperature over all replicas
+    The averages of the replicas are weighted by their number of samples,
+    their errors are taken as independent
+
+    Parameters
+    ----------
+    summaries : list of dictionaries
+        of each replica, temperature : (samples, averages, errors) of U, P, V, rho and N
+    fname : string
+        out filename beginning
+
+    """
+    tempfile = open(fname + '.temps', 'w')
+    tempfile.write('# T samples U P V rho N, errors\n')
+    for T in self.temps:
+      parts = [summary[T] for summary in summaries if T in summary and summary[T][0] > 0]
+      nsamp = sum([part[0] for part in parts])
+      ave = np.zeros((5))
+      err = np.zeros((5))
+      for part in parts:
+        weight = part[0]/float(nsamp)
+        ave += weight*np.array(part[1])
+        err += (weight*np.array(part[2]))**2.
+      tempfile.write('%f %d %s %s\n' % (T, nsamp, ' '.join(['%f' % x for x in ave]),
+                                        ' '.join(['%f' % x for x in np.sqrt(err)])))
+    tempfile.close()
+
+def main(argv=None):
+  parser = commandline('Replica exchange MC')
+  parser.add_argument("--temperatures", type=str, required=True,
+                 help='comma separated temperatures, one replica each')
+  parser.add_argument("--nswap", type=int, default=100,
+                 help='moves between swap attempts')
+  inp = inputs()
+  inp.readcommandline(parser)
+  temps = [float(T) for T in parser.parse_args().temperatures.split(',')]
+  pt = tempering(inp, temps, parser.parse_args().nswap)
+  pt.run()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+import pytest
+from input import inputs
+from simulation import simulation
+
+def setinputs(path,options):
+  inp = inputs()
+  inp.nmol = 40
+  inp.boxlength = [6., 6., 6.]
+  inp.rc = 2.5
+  inp.nmoves = 3000
+  inp.nmovesequil = 500
+  inp.nsample = 10
+  inp.ncheckpoint = 1700
+  inp.seed = 7
+  inp.fname = str(path / 'mc')
+  for name, value in options.items():
+    setattr(inp, name, value)
+  os.makedirs(path, exist_ok=True)
+  return inp
+
+@pytest.mark.parametrize('options', [{}, {'usecells': True, 'skin': 0.3, 'nwidom': 20}])
+def test_restart_matches_run(tmp_path,options):
+  sim = simulation(setinputs(tmp_path / 'whole', options))
+  sim.run()
+  sim.finish()
+  # stop after the checkpoint, as if the run had been killed there
+  inp = setinputs(tmp_path / 'parts', options)
+  sim = simulation(inp)
+  sim.run(0, 2000)
+  sim.chk.wait()
+  del sim
+  inp.restart = True
+  sim = simulation(inp)
+  start = sim.restart()
+  assert start == 1700
+  sim.run(start)
+  sim.finish()
+  for ext in ('.data', '.ave', '.rdf', '.traj'):
+    with open(tmp_path / 'whole' / ('mc' + ext), 'rb') as f:
+      whole = f.read()
+    with open(tmp_path / 'parts' / ('mc' + ext), 'rb') as f:
+      assert f.read() == whole, ext
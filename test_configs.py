@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from configs import trajectory, trajectoryreader
+from particles import particles
+
+def writeframes(fname,ndim,precision,nframes=12,seed=1,append=False):
+  """Frames of a varying number of molecules, returns their steps and positions"""
+  stream = np.random.default_rng(seed)
+  traj = trajectory(ndim, fname, precision, append)
+  frames = []
+  for iframe in range(nframes):
+    nmol = int(stream.integers(0, 30))
+    parts = particles(ndim, 4)
+    parts.setpositions(stream.uniform(-5., 5., (nmol, ndim)))
+    step = 100*iframe + seed
+    traj.writeframe(step, parts)
+    frames.append((step, parts.pos[:nmol].astype(precision)))
+  traj.close()
+  return frames
+
+def checkframes(traj,frames):
+  assert len(traj) == len(frames)
+  for iframe, (step, pos) in enumerate(frames):
+    tstep, tpos = traj.frame(iframe)
+    assert tstep == step
+    assert tpos.dtype == pos.dtype
+    assert np.array_equal(tpos, pos)
+
+@pytest.mark.parametrize('ndim,precision', [(1, 'float64'), (2, 'float32'), (3, 'float64'), (3, 'float32')])
+def test_trajectory_roundtrip(tmp_path,ndim,precision):
+  fname = str(tmp_path / 'mc')
+  frames = writeframes(fname, ndim, precision)
+  # a restart appends to the same files
+  frames += writeframes(fname, ndim, precision, 5, seed=2, append=True)
+  traj = trajectoryreader(fname)
+  assert traj.ndim == ndim
+  checkframes(traj, frames)
+
+@pytest.mark.parametrize('index', ['kept', 'missing', 'empty'])
+def test_trajectory_reindex(tmp_path,index):
+  fname = str(tmp_path / 'mc')
+  frames = writeframes(fname, 3, 'float32')
+  nframe = len(frames)
+  offsets = np.fromfile(fname + '.tridx', dtype=np.int64)
+  # cut the last frame in the middle, as if the run was killed while writing it
+  with open(fname + '.traj', 'r+b') as f:
+    f.truncate(int(offsets[-1]) + 20)
+  if index == 'missing':
+    os.remove(fname + '.tridx')
+  elif index == 'empty':
+    open(fname + '.tridx', 'wb').close()
+  traj = trajectoryreader(fname)
+  checkframes(traj, frames[:nframe-1])
+  # an index that is shorter than the file
+  with open(fname + '.tridx', 'wb') as f:
+    f.write(offsets[:3].tobytes())
+  checkframes(trajectoryreader(fname), frames[:nframe-1])
+  # and one that reaches past the end of the file
+  with open(fname + '.traj', 'r+b') as f:
+    f.truncate(int(offsets[nframe-3]))
+  with open(fname + '.tridx', 'wb') as f:
+    f.write(offsets.tobytes())
+  checkframes(trajectoryreader(fname), frames[:nframe-3])
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from box import box
+from energy import energy
+from particles import particles
+
+# reference versions of the energy kernels, one pair at a time with the
+# analytic potential
+
+def looptype(en,parts,imol,jmol):
+  """Type of one pair, see energy.pairtype"""
+  if en.nspecies == 1:
+    return None
+  species = parts.cache['species']
+  return np.array([species[imol]*en.nspecies + species[jmol]])
+
+def separation(en,pos,imol,jpos):
+  """Minimum image separation pos[imol] - jpos and its square"""
+  r = np.zeros((en.ndim))
+  for idim in range(en.ndim):
+    r[idim] = pos[imol,idim] - jpos[idim]
+  en.box.applypbc(r)
+  r2 = 0.0
+  for idim in range(en.ndim):
+    r2 += r[idim]**2.0
+  return r, r2
+
+def calcforcesloop(en,parts):
+  """Forces, virial and virial tensor, see energy.calcforces"""
+  pos = parts.pos
+  nmol = parts.nmol
+  f = np.zeros((nmol,en.ndim))
+  vir = 0.0
+  virtensor = np.zeros((en.ndim,en.ndim))
+  for imol in range(0,nmol-1):
+    for jmol in range(imol+1,nmol):
+      r, r2 = separation(en, pos, imol, pos[jmol,:])
+      if r2 < en.rc2:
+        tf = float(en.pot.exactforce(np.array([r2]), looptype(en, parts, imol, jmol))[0])*r
+        f[imol,:] += tf
+        f[jmol,:] -= tf
+        vir += np.dot(r, tf)
+        for idim in range(en.ndim):
+          for jdim in range(en.ndim):
+            virtensor[idim,jdim] += r[idim] * tf[jdim]
+  return f, vir, virtensor
+
+def calcfullenergyloop(en,parts):
+  """Total energy with the tail corrections, see energy.calcfullenergy"""
+  pos = parts.pos
+  nmol = parts.nmol
+  u = 0.0
+  for imol in range(0,nmol-1):
+    for jmol in range(imol+1,nmol):
+      r, r2 = separation(en, pos, imol, pos[jmol,:])
+      if r2 < en.rc2:
+        u += float(en.pot.exactenergy(np.array([r2]), looptype(en, parts, imol, jmol))[0])
+  return u + en.pot.utail(en.counts(parts), en.box.vol)
+
+def calcenergyloop(en,parts,mmol):
+  """Energy of molecule mmol with its tail energy, see energy.calcenergy"""
+  pos = parts.pos
+  nmol = parts.nmol
+  e = 0.0
+  for imol in [*range(0,mmol),*range(mmol+1,nmol)]:
+    r, r2 = separation(en, pos, imol, pos[mmol,:])
+    if r2 < en.rc2:
+      e += float(en.pot.exactenergy(np.array([r2]), looptype(en, parts, mmol, imol))[0])
+  if en.pot.tail:
+    species = parts.cache['species'][mmol] if en.nspecies > 1 else 0
+    e += en.pot.utailsingle(en.counts(parts), en.box.vol, species)
+  return e
+
+def setup(ndim,form,nspecies,neighbors,nmol=60,seed=4):
+  """Random configuration of nmol molecules with a cutoff of 2.5"""
+  edges = {1: [40.], 2: [9.,9.], 3: [6.,6.,6.]}[ndim]
+  bx = box()
+  bx.setedges(edges)
+  stream = np.random.default_rng(seed)
+  parts = particles(ndim, nmol)
+  en = energy(nmol, bx, 1.5)
+  if nspecies == 1:
+    en.setparameters(1., 1., 2.5, form)
+  else:
+    parts.setspecies(nspecies)
+    en.setparameters([1., 1.2], [1., 0.8], 2.5, form, overrides={(0,1): (1.1, 0.9, 2.)})
+  parts.setpositions(stream.uniform(bx.box[0,:], bx.box[1,:], (nmol, ndim)),
+                     stream.integers(nspecies, size=nmol))
+  # spread out the overlaps so the energies stay in a sensible range
+  for istep in range(50):
+    en.calcvirial(parts)
+    parts.pos[:nmol] += 1e-3*en.f/np.maximum(1., np.abs(en.f).max())
+    bx.wrap(parts.pos[:nmol])
+  if neighbors == 'cells':
+    bx.setcells(2.5, parts)
+  elif neighbors == 'verlet':
+    en.setverlet(0.4, parts)
+  en.pairblock = 37
+  return en, parts
+
+cases = [(ndim, form, nspecies, neighbors) for ndim in (1, 2, 3)
+         for form in ('truncated', 'shifted', 'forceshifted')
+         for nspecies in (1, 2) for neighbors in (None, 'cells', 'verlet')]
+
+@pytest.mark.parametrize('ndim,form,nspecies,neighbors', cases)
+def test_calcfullenergy(ndim,form,nspecies,neighbors):
+  en, parts = setup(ndim, form, nspecies, neighbors)
+  en.calcfullenergy(parts)
+  assert en.tu == pytest.approx(calcfullenergyloop(en, parts), rel=1e-10)
+
+@pytest.mark.parametrize('ndim,form,nspecies,neighbors', cases)
+def test_calcenergy(ndim,form,nspecies,neighbors):
+  en, parts = setup(ndim, form, nspecies, neighbors)
+  for mmol in range(0, parts.nmol, 7):
+    assert en.calcenergy(parts, mmol) == pytest.approx(calcenergyloop(en, parts, mmol), rel=1e-10, abs=1e-10)
+
+@pytest.mark.parametrize('ndim,form,nspecies,neighbors', cases)
+def test_calcforces(ndim,form,nspecies,neighbors):
+  en, parts = setup(ndim, form, nspecies, neighbors)
+  en.calctensor = True
+  en.vir = 0.0
+  en.virtensor = np.zeros((ndim, ndim))
+  en.calcforces(parts)
+  f, vir, virtensor = calcforcesloop(en, parts)
+  scale = np.abs(f).max()
+  assert np.allclose(en.f, f, rtol=1e-10, atol=1e-10*scale)
+  assert en.vir == pytest.approx(vir, rel=1e-10)
+  assert np.allclose(en.virtensor, virtensor, rtol=1e-10, atol=1e-10*np.abs(virtensor).max())
+
+def test_drift_survives_samples():
+  en, parts = setup(3, 'truncated', 1, None)
+  en.calcfullenergy(parts)
+  ufull = en.tu
+  # a running total that is off by 0.25, then a sample puts it right
+  en.tu += 0.25
+  en.resettotal(ufull)
+  en.tu += 0.5
+  en.checkdrift(parts, 10)
+  istep, urun, u = en.drift[-1]
+  assert istep == 10
+  assert urun - u == pytest.approx(0.75)
+  assert en.tu == pytest.approx(ufull) and en.absorbed == 0.0
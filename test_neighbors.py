@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from box import box
+from energy import energy
+from moves import moves
+from particles import particles
+from rng import rng
+
+def directoccupancy(cav,pos):
+  """Molecules within rcav of every grid cell center, from all the distances"""
+  index = np.array(np.unravel_index(np.arange(np.prod(cav.ngrid)), cav.ngrid)).T
+  centers = cav.box.box[0,:] + (index + 0.5)*cav.spacing
+  r = centers[:,np.newaxis,:] - pos[np.newaxis,:,:]
+  cav.box.minimage(r)
+  return np.sum(np.einsum('ijk,ijk->ij', r, r) < cav.rcav2, axis=1)
+
+def setup(edges,nmol,rcav,seed=3):
+  """Dilute random configuration with cells and cavity-biased moves"""
+  bx = box()
+  bx.setedges(edges)
+  parts = particles(len(edges), 2*nmol)
+  stream = np.random.default_rng(seed)
+  parts.setpositions(stream.uniform(bx.box[0,:], bx.box[1,:], (nmol, len(edges))))
+  en = energy(2*nmol, bx, 1.)
+  en.setparameters(1., 1., 2.5)
+  bx.setcells(2.5, parts)
+  mv = moves(parts, bx, en, 1., -3., rng(seed))
+  mv.settranslation(0.5)
+  mv.setcavity(rcav)
+  return mv
+
+def check(mv):
+  occupancy = directoccupancy(mv.cavity, mv.parts.pos[:mv.nmol])
+  assert np.array_equal(mv.cavity.occupancy, occupancy)
+  assert mv.cavity.ncav == np.sum(occupancy == 0)
+
+# the narrow 2d box has a stencil that reaches some grid cells twice
+cases = [([30.], 20), ([8., 1.5], 3), ([6., 6., 6.], 20)]
+
+@pytest.mark.parametrize('edges,nmol', cases)
+def test_cavity_bookkeeping(edges,nmol):
+  mv = setup(edges, nmol, 0.9)
+  check(mv)
+  for istep in range(60):
+    choice = istep % 3
+    if choice == 0:
+      trial, tnm = mv.insert()
+      if mv.cavity.ncav > 0:
+        assert mv.biasfactor == pytest.approx(mv.cavity.ncav*mv.cavity.cellvol/mv.vol)
+      mv.place(tnm, trial.copy())
+    elif choice == 1:
+      mv.delete(mv.rng.randint(mv.nmol))
+    else:
+      im = mv.rng.randint(mv.nmol)
+      mv.place(im, mv.displace(im).copy())
+    check(mv)
+
+@pytest.mark.parametrize('edges,nmol', cases)
+def test_cavity_removal(edges,nmol):
+  mv = setup(edges, nmol, 0.9)
+  cav = mv.cavity
+  pos = mv.parts.pos[:mv.nmol]
+  for im in range(mv.nmol):
+    occupancy = directoccupancy(cav, np.delete(pos, im, axis=0))
+    own = np.ravel_multi_index(cav.gridindex(pos[im]), cav.ngrid)
+    expected = np.sum(occupancy == 0)*cav.cellvol if occupancy[own] == 0 else 0.
+    assert cav.removal(pos[im]) == pytest.approx(expected)
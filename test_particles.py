@@ -0,0 +1,54 @@
+import numpy as np
+from box import box
+from energy import energy
+from moves import moves
+from particles import particles
+from rng import rng
+
+def mixture(nmol,seed):
+  """Moves of a random two-species mixture, see moves.py"""
+  bx = box()
+  bx.setedges([6., 6., 6.])
+  stream = np.random.default_rng(seed)
+  parts = particles(3, 4)
+  parts.setspecies(2)
+  parts.setpositions(stream.uniform(bx.box[0,:], bx.box[1,:], (nmol, 3)), stream.integers(2, size=nmol))
+  en = energy(nmol, bx, 1.)
+  en.setparameters([1., 1.2], [1., 0.8], 2.5)
+  return moves(parts, bx, en, 1., [-3., -3.5], rng(seed))
+
+def check(parts):
+  species = parts.cache['species'][:parts.nmol]
+  assert np.array_equal(parts.nmolspecies, np.bincount(species, minlength=parts.nspecies))
+
+def test_species_counts():
+  mv = mixture(10, 1)
+  other = mixture(10, 2)
+  check(mv.parts)
+  for istep in range(96):
+    choice = istep % 4
+    if choice == 0:
+      trial, tnm = mv.insert()
+      mv.place(tnm, trial.copy())
+    elif choice == 1:
+      mv.delete(mv.rng.randint(mv.nmol))
+    elif choice == 2:
+      species = mv.parts.cache['species'][:mv.nmol].copy()
+      imol, jmol = mv.rng.randint(mv.nmol), mv.rng.randint(mv.nmol)
+      mv.parts.swap(imol, jmol)
+      species[[imol, jmol]] = species[[jmol, imol]]
+      assert np.array_equal(mv.parts.cache['species'][:mv.nmol], species)
+    else:
+      # a transfer to the other box and back keeps the species, see gibbs.swapmove
+      out, into = (mv, other) if istep % 8 == 3 else (other, mv)
+      im = out.rng.randint(out.nmol)
+      species = out.parts.cache['species'][im]
+      trial, tnm = into.insert(species)
+      pos = out.parts.pos[im].copy()
+      out.delete(im)
+      into.place(tnm, pos)
+      assert into.parts.cache['species'][tnm] == species
+      check(other.parts)
+    check(mv.parts)
+    assert mv.energy.counts(mv.parts) is mv.parts.nmolspecies
+  assert mv.parts.nmol == 10
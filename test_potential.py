@@ -0,0 +1,57 @@
+import math as ma
+import numpy as np
+import pytest
+from potential import mix, potential
+
+def test_lookup_at_cutoff():
+  # r2 just below rc2 rounds up to the end of the table with this cutoff
+  pot = potential(1., 1., 2.809360141291611, 'forceshifted')
+  pot.tabulate(1e-3)
+  r2 = np.array([pot.rc2*(1. - np.finfo(float).eps), pot.rc2*(1. - 1e-12)])
+  assert np.allclose(pot.energy(r2), pot.exactenergy(r2), atol=1e-10)
+  assert np.allclose(pot.force(r2), pot.exactforce(r2), atol=1e-10)
+
+def test_lookup_shares_bins():
+  pot = potential(1., 1., 2.5, 'forceshifted')
+  pot.tabulate(1e-6)
+  r2 = np.random.default_rng(1).uniform(0.3, pot.rc2, 1000)
+  ff = pot.force(r2)
+  # the energy of the same batch reuses the bins of the force
+  assert pot.bins(r2) is pot.binned
+  u = pot.energy(r2)
+  assert np.array_equal(u, pot.energy(r2.copy()))
+  assert np.array_equal(ff, pot.force(r2.copy()))
+  assert np.allclose(u, pot.exactenergy(r2), rtol=1e-6, atol=1e-6)
+  assert np.allclose(ff, pot.exactforce(r2), rtol=1e-6, atol=1e-6)
+
+def test_mix():
+  sigma, epsilon, rc = mix([1., 1.2], [1., 0.8], 2.5)
+  assert np.allclose(sigma, [[1., 1.1], [1.1, 1.2]])
+  assert np.allclose(epsilon, [[1., ma.sqrt(0.8)], [ma.sqrt(0.8), 0.8]])
+  assert np.all(rc == 2.5)
+  sigma, epsilon, rc = mix([1., 1.2], [1., 0.8], 2.5, 'geometric')
+  assert np.allclose(sigma, [[1., ma.sqrt(1.2)], [ma.sqrt(1.2), 1.2]])
+  assert np.allclose(epsilon, [[1., ma.sqrt(0.8)], [ma.sqrt(0.8), 0.8]])
+  sigma, epsilon, rc = mix([1., 1.2, 0.9], [1., 0.8, 1.1], 2.5, overrides={(2,0): (1.3, 0.7, 2.)})
+  assert sigma[0,2] == sigma[2,0] == 1.3
+  assert epsilon[0,2] == epsilon[2,0] == 0.7
+  assert rc[0,2] == rc[2,0] == 2.
+  assert sigma[1,2] == pytest.approx(1.05) and rc[1,2] == 2.5
+  with pytest.raises(ValueError):
+    mix([1., 1.2], [1., 0.8], 2.5, overrides={(0,1): (1.1, 0.9, 3.)})
+  with pytest.raises(ValueError):
+    mix([1., 1.2], [1., 0.8], 2.5, 'arithmetic')
+
+@pytest.mark.parametrize('ndim', [1, 2, 3])
+def test_tailsingle(ndim):
+  sigma, epsilon, rc = mix([1., 1.2, 0.9], [1., 0.8, 1.1], 2.5, overrides={(0,1): (1.1, 0.9, 2.)})
+  pot = potential(sigma, epsilon, rc.max(), 'truncated', ndim)
+  n = np.array([5, 7, 3])
+  vol = 100.
+  for species in range(3):
+    less = n.copy()
+    less[species] -= 1
+    assert pot.utailsingle(n, vol, species) == pytest.approx(pot.utail(n, vol) - pot.utail(less, vol), rel=1e-12)
+    assert pot.utailsingle12(n, vol, species) == pytest.approx(pot.utail12(n, vol) - pot.utail12(less, vol), rel=1e-12)
+  pot = potential(1., 1., 2.5, 'truncated', ndim)
+  assert pot.utailsingle(15, vol) == pytest.approx(pot.utail(15, vol) - pot.utail(14, vol), rel=1e-12)
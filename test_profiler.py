@@ -0,0 +1,28 @@
+from input import inputs
+from simulation import simulation
+
+def test_profile(tmp_path):
+  inp = inputs()
+  inp.nmol = 40
+  inp.boxlength = [6., 6., 6.]
+  inp.rc = 2.5
+  inp.nmoves = 400
+  inp.nmovesequil = 100
+  inp.seed = 3
+  inp.writeconfigs = False
+  inp.profile = True
+  inp.fname = str(tmp_path / 'mc')
+  sim = simulation(inp)
+  sim.run()
+  sim.finish()
+  phases = {}
+  for line in open(inp.fname + '.perf'):
+    if line.startswith('# movetype'):
+      break
+    if not line.startswith('#'):
+      fields = line.split()
+      phases[fields[0]] = (int(fields[1]), int(fields[5]))
+  assert phases['move'][0] == inp.nmoves
+  assert phases['calcenergy'][0] >= 2*inp.nmoves
+  assert phases['calcenergy'][1] > 0
+  assert phases['sample'][0] > 0
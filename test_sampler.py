@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from box import box
+from energy import energy
+from input import inputs
+from particles import particles
+from rng import rng
+from sampler import sampler, rdfaccumulator, widomaccumulator
+from simulation import simulation
+
+def test_widom_all_overlap():
+  # on a lattice with spacing sigma/2 every test molecule overlaps, and at
+  # this temperature all the Boltzmann factors underflow to 0
+  bx = box()
+  bx.setedges([5., 5., 5.])
+  grid = bx.box[0,0] + 0.5*np.arange(10)
+  pos = np.array(np.meshgrid(grid, grid, grid)).reshape((3, -1)).T
+  parts = particles(3, len(pos))
+  parts.setpositions(pos)
+  en = energy(len(pos), bx, 1e-305)
+  en.setparameters(1., 1., 2.5)
+  widom = widomaccumulator(en, bx, 1e-305, 20, rng(2))
+  with np.errstate(over='ignore'):
+    for isample in range(3):
+      widom.finish(parts, bx.vol)
+  assert widom.shift is None
+  assert widom.muexcess()[0] == np.inf
+
+def test_widom_leaves_run_unchanged(tmp_path):
+  final = []
+  for nwidom in (0, 50):
+    inp = inputs()
+    inp.nmol = 40
+    inp.boxlength = [6., 6., 6.]
+    inp.rc = 2.5
+    inp.nmoves = 6000
+    inp.nmovesequil = 500
+    inp.nsample = 10
+    inp.nwidom = nwidom
+    inp.seed = 5
+    inp.writeconfigs = False
+    inp.fname = str(tmp_path / ('mc%d' % nwidom))
+    sim = simulation(inp)
+    sim.run()
+    state = sim.rng.getstate()
+    final.append((state['generator'], state['index'], sim.parts.pos[:sim.parts.nmol].copy()))
+  # the run drew the same random numbers and ended in the same place
+  assert final[0][:2] == final[1][:2]
+  assert np.array_equal(final[0][2], final[1][2])
+
+@pytest.mark.parametrize('ndim,scales', [(1, [1.]), (2, [1.]), (3, [1.]),
+                                         (1, [1., 0.8]), (3, [1., 0.8])])
+def test_rdf_ideal_gas(ndim,scales):
+  # random configurations have g(r) = 1; with two box sizes the cutoff
+  # changes as in an NPT run and the outer bins are only seen by the
+  # samples of the larger box
+  edges = {1: 40., 2: 9., 3: 6.}[ndim]
+  nmol = 200
+  stream = np.random.default_rng(ndim)
+  bx = box()
+  bx.setedges([edges]*ndim)
+  parts = particles(ndim, nmol)
+  en = energy(nmol, bx, 1.)
+  en.setparameters(1., 1., 2.5)
+  smp = sampler(en)
+  rdf = smp.add(rdfaccumulator(en.rc, 25, en if len(scales) > 1 else None))
+  for isample in range(200):
+    s = scales[isample % len(scales)]
+    bx.setedges([edges*s]*ndim)
+    en.setcutoff(2.5*s)
+    parts.setpositions(stream.uniform(bx.box[0,:], bx.box[1,:], (nmol, ndim)))
+    smp.sample(parts, bx.vol)
+  rmid, shell = rdf.shellvolumes(ndim)
+  expected = rdf.nideal*shell
+  assert np.all(expected > 0)
+  assert np.all(np.abs(rdf.hist - expected) < 5.*np.sqrt(expected) + 1.)
+  rmid, g = rdf.gofr(ndim)
+  assert np.average(g, weights=expected) == pytest.approx(1., abs=0.01)
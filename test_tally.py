@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from tally import blockstats
+
+def ar1(phi,n,seed):
+  """AR(1) series x_t = phi x_t-1 + e_t of unit variance noise e_t"""
+  noise = np.random.default_rng(seed).normal(size=n)
+  x = np.zeros((n))
+  for i in range(1, n):
+    x[i] = phi*x[i-1] + noise[i]
+  return x
+
+def blocking(x):
+  """Flyvbjerg-Petersen blocking of a whole series, error of each level
+  and the one picked by the criterion of Lee et al., see blockstats.error"""
+  n = len(x)
+  errors = []
+  while len(x) >= 2:
+    errors.append(np.std(x, ddof=1)/np.sqrt(len(x)))
+    m = len(x)//2
+    x = 0.5*(x[0:2*m:2] + x[1:2*m:2])
+  errors = np.array(errors)
+  for level in range(len(errors)):
+    if (2.**level)**3 > 2*n*(errors[level]/errors[0])**4:
+      return errors, errors[level]
+  return errors, np.max(errors)
+
+def test_blockstats_error():
+  phis = [0., 0.5, 0.9]
+  n = 2**15 + 37
+  series = np.array([ar1(phi, n, iphi) for iphi, phi in enumerate(phis)]).T
+  stats = blockstats(len(phis))
+  for x in series:
+    stats.add(x)
+  assert np.allclose(stats.average(), np.mean(series, axis=0), rtol=1e-12, atol=1e-14)
+  for iphi, phi in enumerate(phis):
+    errors, error = blocking(series[:,iphi])
+    assert np.allclose(stats.blockerrors()[:,iphi], errors, rtol=1e-10)
+    assert stats.error()[iphi] == pytest.approx(error, rel=1e-10)
+    # and the picked error is near the exact one of an AR(1) mean
+    exact = np.sqrt((1. + phi)/(1. - phi)/(1. - phi*phi)/n)
+    assert error == pytest.approx(exact, rel=0.2)
+
+def test_blockstats_state():
+  series = ar1(0.8, 3001, 4)[:,np.newaxis]*[1., -2.]
+  whole = blockstats(2)
+  for x in series:
+    whole.add(x)
+  first = blockstats(2)
+  # an odd number of samples leaves blocks waiting for their partners
+  for x in series[:1235]:
+    first.add(x)
+  state = first.getstate()
+  resumed = blockstats(2)
+  resumed.setstate({key: np.array(value) for key, value in state.items()})
+  for x in series[1235:]:
+    resumed.add(x)
+  assert resumed.nsamp == whole.nsamp
+  assert np.array_equal(resumed.average(), whole.average())
+  assert np.array_equal(resumed.blockerrors(), whole.blockerrors())
+  assert np.array_equal(resumed.error(), whole.error())